@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "inventory.middleware.QueryBudgetMiddleware",  # first, so its total covers everything below
     "corsheaders.middleware.CorsMiddleware", # CORS
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -64,14 +66,17 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "inventory.middleware.PresenceMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "inventory.middleware.ProfilerMiddleware",  # last: it calls the view itself when profiling
 ]
 
 ROOT_URLCONF = "core.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that reports render time to QueryBudgetMiddleware
+        "BACKEND": "inventory.template_backends.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / 'templates'],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -155,6 +160,83 @@ WHITENOISE_USE_FINDERS = True
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Cache (inventory.cache: catalog / store / stock reads with version-key invalidation).
+# Needs no external service: "file" (default) is shared by every process on the host,
+# including the import worker; "db" is shared across hosts (run `manage.py createcachetable`
+# once); "locmem" is per process, so only suitable for a single-process server.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "file")
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "inventory"),
+    "file": ("inventory.cache_backends.FileCache", str(BASE_DIR / "cache")),
+    "db": ("django.core.cache.backends.db.DatabaseCache", "inventory_cache"),
+}
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": os.environ.get("CACHE_LOCATION", CACHE_BACKENDS[CACHE_BACKEND][1]),
+        "TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", 3600)),
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+}
+
+# Product live search (inventory.search)
+SEARCH_RESULTS = 50
+SEARCH_MAX_RESULTS = 200
+
+# Active user tracking (inventory.middleware.PresenceMiddleware)
+PRESENCE_INTERVAL = int(os.environ.get("PRESENCE_INTERVAL", 60))  # seconds between last-seen writes per user
+ACTIVE_USER_MINUTES = int(os.environ.get("ACTIVE_USER_MINUTES", 15))
+
+# Query budgets (inventory.middleware.QueryBudgetMiddleware): requests running more
+# queries than their URL name's budget are logged on `inventory.performance`.
+# The budgets leave headroom over what the pages run with `seed_bench` data.
+QUERY_BUDGET_DEFAULT = int(os.environ.get("QUERY_BUDGET_DEFAULT", 50))
+QUERY_BUDGETS = {
+    "dashboard": 30,
+    "product_list": 10,
+    "product_search": 10,
+    "pos": 40,  # includes checkout
+    "pos_cart": 10,
+    "purchase": 50,
+    "reports": 15,
+    "sales_ledger": 15,
+    "product-list": 10,
+}
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "True") == "True"
+
+# Request profiling (inventory.middleware.ProfilerMiddleware). Superusers profile any
+# request with ?profile=1 or an "X-Profile: 1" header; URL names listed here are also
+# profiled for that fraction of requests, e.g. {"reports": 0.01}.
+PROFILE_SAMPLE_RATES = json.loads(os.environ.get("PROFILE_SAMPLE_RATES", "{}"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))  # newest profiles kept
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"inventory.performance": {"handlers": ["console"], "level": "WARNING", "propagate": False}},
+}
+
+# Bulk import: rows per bulk_create batch
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 1000))
+# Import jobs still RUNNING without a heartbeat for this long are handed to another worker
+IMPORT_JOB_STALE_MINUTES = int(os.environ.get("IMPORT_JOB_STALE_MINUTES", 30))
+
+# Stock movement API (POST /api/stock-movements/): movements accepted per request
+STOCK_MOVEMENTS_MAX = int(os.environ.get("STOCK_MOVEMENTS_MAX", 1000))
+# Offline POS sync (POST /api/pos/sync/): queued sales accepted per upload
+POS_SYNC_MAX_SALES = int(os.environ.get("POS_SYNC_MAX_SALES", 500))
+
+# Data exports (/exports/<kind>/): rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 2000))
+
+# History archival (inventory.archive): monthly gzip'd CSV files for StockLog/Sale rows
+ARCHIVE_ROOT = Path(os.environ.get("ARCHIVE_ROOT", BASE_DIR / 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 730))  # archive_history default cutoff
+
+# Stock snapshots (inventory.snapshots): daily checkpoints kept this long, then one per month
+STOCK_SNAPSHOT_DAILY_DAYS = int(os.environ.get("STOCK_SNAPSHOT_DAILY_DAYS", 90))
+
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
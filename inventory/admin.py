@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import Category, Product, StockLog, Sale, SaleItem
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import Category, Product, StockLog, Sale, SaleItem, SyncedSale, ArchiveSegment, RequestProfile
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -11,7 +17,15 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'code', 'category', 'purchase_price', 'selling_price', 'quantity', 'is_low_stock')
     search_fields = ('name', 'code')
     list_filter = ('category',)
-    readonly_fields = ('created_at', 'updated_at')
+    # quantity is the sum of the Stock rows, moved only by stock movements
+    readonly_fields = ('quantity', 'created_at', 'updated_at')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Don't write back the loaded quantity, a sale may have moved it since
+            obj.save(update_fields=[f.name for f in Product._meta.concrete_fields if not f.primary_key and f.name != 'quantity'])
+        else:
+            obj.save()
 
     def is_low_stock(self, obj):
         return obj.is_low_stock
@@ -31,3 +45,49 @@ class SaleItemInline(admin.TabularInline):
 class SaleAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'total_amount', 'date')
     inlines = [SaleItemInline]
+
+@admin.register(SyncedSale)
+class SyncedSaleAdmin(admin.ModelAdmin):
+    list_display = ('key', 'terminal', 'order_id', 'synced_at')
+    list_filter = ('terminal',)
+    search_fields = ('key', 'order_id')
+    readonly_fields = ('key', 'terminal', 'sale', 'order_id', 'synced_at')
+
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'month', 'rows', 'path', 'created_at')
+    list_filter = ('kind',)
+    readonly_fields = ('kind', 'month', 'path', 'rows', 'first_id', 'last_id', 'sha256', 'created_at')
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'url_name', 'user', 'reason', 'status_code', 'duration_ms', 'queries', 'download')
+    list_filter = ('reason', 'url_name')
+    search_fields = ('path', 'query_string')
+    exclude = ('stats',)
+    readonly_fields = ('created_at', 'user', 'method', 'path', 'query_string', 'url_name', 'reason',
+                       'status_code', 'duration_ms', 'queries', 'download', 'summary_text')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='inventory_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.prof"'
+        return response
+
+    @admin.display(description='Profile')
+    def download(self, obj):
+        return format_html('<a href="{}">Download .prof</a>', reverse('admin:inventory_requestprofile_download', args=[obj.pk]))
+
+    @admin.display(description='Top functions')
+    def summary_text(self, obj):
+        return format_html('<pre style="font-size: 0.75rem;">{}</pre>', obj.summary)
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class InventoryConfig(AppConfig):
     name = "inventory"
+
+    def ready(self):
+        from . import cache  # noqa: F401  (connects the invalidation signals)
+        from .search import repair_search_triggers
+        post_migrate.connect(repair_search_triggers, sender=self)
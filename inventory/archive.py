@@ -0,0 +1,242 @@
+import csv
+import gzip
+import hashlib
+import os
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import StockLog, Sale, SaleItem, Customer, SalesPerson, Store, Product, ArchiveSegment
+
+
+# Hot/cold history. `archive_history` moves whole months of StockLog and Sale (with their
+# SaleItems) older than a cutoff into gzip'd CSV files under ARCHIVE_ROOT, one file per
+# kind and month, listed in ArchiveSegment. Archived months are strictly older than
+# anything left in the live tables, so readers take what they can from the database and
+# only open archive files when a query runs past the live rows.
+# Sales totals are unaffected: reports read DailySalesRollup, which is never archived.
+
+MODELS = {'stocklog': StockLog, 'sale': Sale, 'saleitem': SaleItem}
+DATE_FIELDS = {'stocklog': 'timestamp', 'sale': 'date'}  # kinds that archived() can query
+
+
+def month_start(value):
+    day = timezone.localdate(value) if isinstance(value, datetime) else value
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_bounds(month):
+    start = timezone.make_aware(datetime.combine(month, time.min))
+    return start, timezone.make_aware(datetime.combine(next_month(month), time.min))
+
+
+def columns(model):
+    return [f.attname for f in model._meta.concrete_fields]
+
+
+def _dump(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _load(field, value):
+    if value == '' and field.null:
+        return None
+    return field.to_python(value)
+
+
+def _segment_path(kind, month):
+    parts = ArchiveSegment.objects.filter(kind=kind, month=month).count()
+    name = f"{month:%Y-%m}.csv.gz" if not parts else f"{month:%Y-%m}.{parts + 1}.csv.gz"
+    return Path(kind) / name
+
+
+def _write_segment(kind, month, queryset):
+    """Write `queryset` (ordered by id) to a new archive file and record it. Returns the
+    segment, or None when there was nothing to write."""
+    model = MODELS[kind]
+    names = columns(model)
+    rel_path = _segment_path(kind, month)
+    path = Path(settings.ARCHIVE_ROOT) / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+
+    rows = 0
+    first_id = last_id = None
+    with gzip.open(tmp, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for row in queryset.order_by('id').values_list(*names).iterator(chunk_size=2000):
+            writer.writerow([_dump(v) for v in row])
+            rows += 1
+            first_id = first_id or row[0]
+            last_id = row[0]
+    if not rows:
+        tmp.unlink()
+        return None
+
+    digest = hashlib.sha256()
+    with open(tmp, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    os.replace(tmp, path)
+    return ArchiveSegment.objects.create(
+        kind=kind, month=month, path=str(rel_path), rows=rows,
+        first_id=first_id, last_id=last_id, sha256=digest.hexdigest(),
+    )
+
+
+def _archive(kinds_and_querysets, month):
+    """Write every (kind, queryset) for `month`, then delete the archived rows, all in one
+    transaction. Files written for a transaction that fails are removed again."""
+    written = []
+    try:
+        with transaction.atomic():
+            for kind, queryset in kinds_and_querysets:
+                segment = _write_segment(kind, month, queryset)
+                if segment:
+                    written.append((segment, queryset))
+            # Delete children first (SaleItem before Sale); only ids that made it into a file
+            for segment, queryset in reversed(written):
+                queryset.filter(id__lte=segment.last_id).delete()
+    except BaseException:
+        for segment, _ in written:
+            (Path(settings.ARCHIVE_ROOT) / segment.path).unlink(missing_ok=True)
+        raise
+    return [segment for segment, _ in written]
+
+
+def archive_month(month, kind):
+    """Archive one month of 'stocklog' or 'sales' (Sale + SaleItem). Returns the new segments."""
+    start, end = month_bounds(month)
+    if kind == 'stocklog':
+        return _archive([('stocklog', StockLog.objects.filter(timestamp__gte=start, timestamp__lt=end))], month)
+    return _archive([
+        ('sale', Sale.objects.filter(date__gte=start, date__lt=end)),
+        ('saleitem', SaleItem.objects.filter(sale__date__gte=start, sale__date__lt=end)),
+    ], month)
+
+
+def months_to_archive(kind, before):
+    """Months with live rows of `kind` ('stocklog' or 'sales') that end before `before`."""
+    model, field = (StockLog, 'timestamp') if kind == 'stocklog' else (Sale, 'date')
+    oldest = model.objects.aggregate(oldest=Min(field))['oldest']
+    if oldest is None:
+        return []
+    months = []
+    month = month_start(oldest)
+    while month < month_start(before):
+        start, end = month_bounds(month)
+        if model.objects.filter(**{f'{field}__gte': start, f'{field}__lt': end}).exists():
+            months.append(month)
+        month = next_month(month)
+    return months
+
+
+def archived_until(kind):
+    """First local date after the newest archived month of `kind`, or None."""
+    latest = ArchiveSegment.objects.filter(kind=kind).order_by('-month').values_list('month', flat=True).first()
+    return next_month(latest) if latest else None
+
+
+def read_segment(segment):
+    model = MODELS[segment.kind]
+    fields = {f.attname: f for f in model._meta.concrete_fields}
+    with gzip.open(Path(settings.ARCHIVE_ROOT) / segment.path, 'rt', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        for row in reader:
+            yield model(**{name: _load(fields[name], value) for name, value in zip(header, row)})
+
+
+def archived(kind, start=None, end=None, match=None, before=None, limit=None):
+    """Archived rows of `kind`, newest first, with start <= date < end, for which
+    match(row) is true and whose (date, id) is below `before`. Whole months are read,
+    oldest months only when newer ones didn't fill `limit`."""
+    date_attr = DATE_FIELDS[kind]
+    segments = ArchiveSegment.objects.filter(kind=kind)
+    if start:
+        segments = segments.filter(month__gte=month_start(start))
+    if end:
+        segments = segments.filter(month__lte=timezone.localdate(end))
+    if before:
+        segments = segments.filter(month__lte=timezone.localdate(before[0]))
+
+    found = []
+    for month, parts in groupby(segments.order_by('-month', 'id'), key=lambda s: s.month):
+        if limit and len(found) >= limit:
+            break
+        for segment in parts:
+            for row in read_segment(segment):
+                key = (getattr(row, date_attr), row.id)
+                if start and key[0] < start or end and key[0] >= end:
+                    continue
+                if before and key >= tuple(before):
+                    continue
+                if match and not match(row):
+                    continue
+                found.append(row)
+    found.sort(key=lambda r: (getattr(r, date_attr), r.id), reverse=True)
+    return found[:limit] if limit else found
+
+
+def attach_sale_relations(sales):
+    # Archived rows only carry ids; fetch the related objects the templates use in bulk
+    related = {
+        'user': User, 'customer': Customer, 'sales_person': SalesPerson,
+        'source_store': Store, 'destination_store': Store,
+    }
+    for name, model in related.items():
+        objs = model.objects.in_bulk({getattr(s, f'{name}_id') for s in sales} - {None})
+        for s in sales:
+            setattr(s, name, objs.get(getattr(s, f'{name}_id')))
+    return sales
+
+
+def archived_sale(sale_id):
+    """(sale, items) for an archived sale id, or None."""
+    segment = ArchiveSegment.objects.filter(kind='sale', first_id__lte=sale_id, last_id__gte=sale_id)
+    for seg in segment:
+        sale = next((s for s in read_segment(seg) if s.id == sale_id), None)
+        if sale is None:
+            continue
+        items = []
+        for item_seg in ArchiveSegment.objects.filter(kind='saleitem', month=seg.month):
+            items += [i for i in read_segment(item_seg) if i.sale_id == sale_id]
+        products = Product.objects.in_bulk({i.product_id for i in items})
+        for item in items:
+            item.product = products.get(item.product_id)
+            item.sale = sale
+        return attach_sale_relations([sale])[0], items
+    return None
+
+
+def stock_history(product_id, start=None, end=None, limit=500):
+    """A product's StockLog rows newest first, from the live table and, past its end,
+    from the archive."""
+    logs = StockLog.objects.filter(product_id=product_id)
+    if start:
+        logs = logs.filter(timestamp__gte=start)
+    if end:
+        logs = logs.filter(timestamp__lt=end)
+    rows = list(logs.order_by('-timestamp', '-id')[:limit])
+    if len(rows) < limit:
+        before = (rows[-1].timestamp, rows[-1].id) if rows else None
+        rows += archived(
+            'stocklog', start, end, match=lambda r: r.product_id == product_id,
+            before=before, limit=limit - len(rows),
+        )
+    return rows
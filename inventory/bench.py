@@ -0,0 +1,373 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import bump
+from .models import (
+    Store, Category, Product, Stock, StockLog, Customer, SalesPerson, OrderCounter,
+    Sale, SaleItem, Purchase, PurchaseItem,
+)
+from .reports import rebuild_rollups
+from .stock import recompute_totals, rebuild_valuations
+
+
+# Benchmark data and timings. `seed_bench` fills an empty database with a seeded (so
+# repeatable) dataset using bulk inserts only; `bench` runs the hot pages against it
+# through the test client and writes wall time, query count and peak memory per page
+# to a JSON report that later runs are compared with.
+#
+# StockLog rows form a consistent movement history for every Stock row (each starts
+# with a purchase and never goes below zero, and Stock is their sum). Sales and
+# purchases are generated separately, for the reports and ledgers, and don't move stock.
+
+BENCH_USER = 'bench'
+BENCH_STORE_PREFIX = 'Bench Store '
+BATCH = 5000
+
+SIZES = {
+    'stores': 30,
+    'categories': 200,
+    'products': 50_000,
+    'stock_logs': 5_000_000,
+    'customers': 5_000,
+    'sales_people': 50,
+    'sales': 200_000,
+    'purchases': 20_000,
+}
+
+WORDS = (
+    'Steel', 'Cotton', 'Basic', 'Premium', 'Mini', 'Large', 'Eco', 'Smart', 'Classic', 'Pro',
+    'Cable', 'Shirt', 'Bottle', 'Lamp', 'Charger', 'Notebook', 'Mug', 'Filter', 'Bag', 'Sensor',
+)
+
+
+def _insert(model, objs, batch=BATCH):
+    """bulk_create an iterable of unsaved objects in batches. Returns the count."""
+    count = 0
+    chunk = []
+    for obj in objs:
+        chunk.append(obj)
+        if len(chunk) >= batch:
+            model.objects.bulk_create(chunk)
+            count += len(chunk)
+            chunk = []
+    model.objects.bulk_create(chunk)
+    return count + len(chunk)
+
+
+@contextmanager
+def _explicit_dates(*fields):
+    # Sale.date / Purchase.date are auto_now_add, which bulk_create would overwrite with now
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field, _ in saved:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in saved:
+            field.auto_now_add = value
+
+
+def _bulk_with_ids(model, objs):
+    model.objects.bulk_create(objs)
+    if objs and objs[0].pk is None:
+        # Backends that can't return ids from a bulk insert; order numbers are unique
+        ids = dict(model.objects.filter(order_id__in=[o.order_id for o in objs]).values_list('order_id', 'id'))
+        for obj in objs:
+            obj.pk = ids[obj.order_id]
+
+
+def _money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def bench_user(password=None):
+    """The staff user the benchmark runs as, with every inventory permission but not a
+    superuser. Without `password` it gets an unusable one (`bench` logs in by itself)."""
+    user, new = User.objects.get_or_create(username=BENCH_USER, defaults={'is_staff': True})
+    if password:
+        user.set_password(password)
+    elif new or user.check_password(BENCH_USER):
+        user.set_unusable_password()  # also retires the bench/bench login older seeds made
+    user.is_superuser = False
+    user.save()
+    user.user_permissions.set(Permission.objects.filter(content_type__app_label='inventory'))
+    return user
+
+
+def seed(sizes, seed=42, days=365, log=print, password=None):
+    """Generate the benchmark dataset. Returns {model name: rows created}."""
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    span = days * 86400
+
+    def when():
+        return start + timedelta(seconds=rng.uniform(0, span))
+
+    created = {}
+    user = bench_user(password)
+
+    created['stores'] = _insert(Store, (
+        Store(name=f"{BENCH_STORE_PREFIX}{i:02d}", location=f"Area {i % 7}") for i in range(sizes['stores'])
+    ))
+    store_ids = list(Store.objects.filter(name__startswith=BENCH_STORE_PREFIX).values_list('id', flat=True))
+    created['categories'] = _insert(Category, (
+        Category(name=f"Bench {rng.choice(WORDS)} {i}") for i in range(sizes['categories'])
+    ))
+    category_ids = list(Category.objects.filter(name__startswith='Bench ').values_list('id', flat=True))
+
+    def product(i):
+        cost = _money(rng.uniform(0.5, 200))
+        return Product(
+            name=f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}", code=f"B{i:07d}",
+            category_id=rng.choice(category_ids), purchase_price=cost,
+            selling_price=_money(cost * Decimal(rng.uniform(1.2, 1.8))),
+            min_stock_alert=rng.randint(5, 20), supplier_name=f"Supplier {rng.randint(1, 40)}",
+        )
+    created['products'] = _insert(Product, (product(i) for i in range(sizes['products'])))
+    products = list(Product.objects.filter(code__startswith='B').values_list('id', 'purchase_price', 'selling_price'))
+    log(f"  {len(products)} products")
+
+    # Stock: every product is stocked in a few stores; the logs are spread over those pairs
+    pairs = []
+    for product_id, _, _ in products:
+        for store_id in rng.sample(store_ids, rng.randint(1, max(1, min(len(store_ids), 10)))):
+            pairs.append((store_id, product_id))
+    per_pair, extra = divmod(sizes['stock_logs'], len(pairs)) if pairs else (0, 0)
+    quantities = []
+
+    def movements():
+        for index, (store_id, product_id) in enumerate(pairs):
+            count = per_pair + (1 if index < extra else 0)
+            balance = 0
+            for n, moment in enumerate(sorted(when() for _ in range(count))):
+                if n == 0:
+                    action, change = 'PURCHASE', rng.randint(20, 200)
+                else:
+                    action = rng.choice(('SALE', 'SALE', 'SALE', 'ADJUST', 'TRANSFER_OUT', 'TRANSFER_IN', 'PURCHASE'))
+                    if action in ('PURCHASE', 'TRANSFER_IN'):
+                        change = rng.randint(5, 100)
+                    elif action == 'ADJUST':
+                        change = rng.randint(-min(balance, 3), 3) or 1
+                    else:
+                        change = -min(balance, rng.randint(1, 5))
+                        if not change:
+                            action, change = 'PURCHASE', rng.randint(20, 200)
+                balance += change
+                yield StockLog(
+                    product_id=product_id, store_id=store_id, user=user, action=action,
+                    quantity_change=change, reason="Bench data", timestamp=moment,
+                )
+            quantities.append(balance)
+
+    created['stock_logs'] = _insert(StockLog, movements())
+    created['stock'] = _insert(Stock, (
+        Stock(store_id=store_id, product_id=product_id, quantity=quantity)
+        for (store_id, product_id), quantity in zip(pairs, quantities)
+    ))
+    log(f"  {created['stock_logs']} stock logs over {created['stock']} stock rows")
+
+    created['customers'] = _insert(Customer, (
+        Customer(name=f"Customer {i}", phone=f"9{i:09d}") for i in range(sizes['customers'])
+    ))
+    created['sales_people'] = _insert(SalesPerson, (
+        SalesPerson(name=f"Seller {i}", phone=f"8{i:09d}") for i in range(sizes['sales_people'])
+    ))
+    customer_ids = list(Customer.objects.filter(phone__startswith='9').values_list('id', flat=True))
+    seller_ids = list(SalesPerson.objects.filter(phone__startswith='8').values_list('id', flat=True))
+
+    with _explicit_dates(Sale._meta.get_field('date'), Purchase._meta.get_field('date')):
+        created['sales'] = created['sale_items'] = 0
+        for offset in range(0, sizes['sales'], BATCH):
+            sales, lines = [], []
+            for _ in range(min(BATCH, sizes['sales'] - offset)):
+                source = rng.choice(store_ids)
+                transfer = len(store_ids) > 1 and rng.random() < 0.05
+                items = [(p_id, rng.randint(1, 4), Decimal(0) if transfer else price)
+                         for p_id, _, price in rng.sample(products, rng.randint(1, min(5, len(products))))]
+                sales.append(Sale(
+                    user=user, source_store_id=source, is_transfer=transfer, date=when(),
+                    destination_store_id=rng.choice([s for s in store_ids if s != source]) if transfer else None,
+                    customer_id=None if transfer else rng.choice(customer_ids),
+                    sales_person_id=rng.choice(seller_ids) if seller_ids and rng.random() < 0.7 else None,
+                    total_amount=sum(qty * price for _, qty, price in items),
+                ))
+                lines.append(items)
+            numbers = {prefix: iter(OrderCounter.reserve(prefix, sum(1 for s in sales if (s.is_transfer) == (prefix == 'TR-'))))
+                       for prefix in ('SO-', 'TR-')}
+            for sale in sales:
+                sale.order_id = next(numbers['TR-' if sale.is_transfer else 'SO-'])
+            _bulk_with_ids(Sale, sales)
+            created['sales'] += len(sales)
+            created['sale_items'] += _insert(SaleItem, (
+                SaleItem(sale=sale, product_id=p_id, quantity=qty, unit_price=price, subtotal=qty * price)
+                for sale, items in zip(sales, lines) for p_id, qty, price in items
+            ))
+
+        created['purchases'] = created['purchase_items'] = 0
+        for offset in range(0, sizes['purchases'], BATCH):
+            purchases, lines = [], []
+            count = min(BATCH, sizes['purchases'] - offset)
+            for order_id in OrderCounter.reserve('PO-', count):
+                items = [(p_id, rng.randint(10, 200), cost)
+                         for p_id, cost, _ in rng.sample(products, rng.randint(1, min(30, len(products))))]
+                purchases.append(Purchase(
+                    order_id=order_id, user=user, supplier=f"Supplier {rng.randint(1, 40)}",
+                    destination_store_id=rng.choice(store_ids), date=when(),
+                    total_amount=sum(qty * cost for _, qty, cost in items),
+                ))
+                lines.append(items)
+            _bulk_with_ids(Purchase, purchases)
+            created['purchases'] += len(purchases)
+            created['purchase_items'] += _insert(PurchaseItem, (
+                PurchaseItem(purchase=purchase, product_id=p_id, quantity=qty, unit_cost=cost, subtotal=qty * cost)
+                for purchase, items in zip(purchases, lines) for p_id, qty, cost in items
+            ))
+    log(f"  {created['sales']} sales, {created['purchases']} purchases")
+
+    # Derived tables, as the application would have maintained them
+    recompute_totals()
+    rebuild_valuations()
+    rebuild_rollups()
+    bump('catalog', 'categories', 'stores', *(f'stock:{store_id}' for store_id in store_ids))
+    return created
+
+
+# --- Timings ----------------------------------------------------------------
+
+def _pos_checkout(client, context):
+    client.post(reverse('pos_cart'), json.dumps({'action': 'add', 'product_id': context['product_id'], 'quantity': 1}),
+                content_type='application/json', secure=True)
+    return lambda: client.post(reverse('pos'), {
+        'action': 'checkout', 'sale_type': 'sale',
+        'source_store_id': context['store_id'], 'customer_id': context['customer_id'],
+    }, secure=True)
+
+
+def _get(name):
+    def prepare(client, context):
+        url = reverse(name)
+        return lambda: client.get(url, secure=True)
+    return prepare
+
+
+# name -> prepare(client, context) returning the request to measure. Checkout sells one
+# unit per run from a bench store, so run() refuses databases without the seeded data.
+SCENARIOS = {
+    'dashboard': _get('dashboard'),
+    'product_list': _get('product_list'),
+    'pos_view': _get('pos'),
+    'pos_checkout': _pos_checkout,
+    'report_view': _get('reports'),
+    'sales_ledger': _get('sales_ledger'),
+    'api_products': _get('product-list'),
+}
+
+
+def _context():
+    stock = Stock.objects.filter(store__name__startswith=BENCH_STORE_PREFIX, quantity__gte=100).values(
+        'store_id', 'product_id').first() or {}
+    return {
+        'store_id': stock.get('store_id'),
+        'product_id': stock.get('product_id'),
+        'customer_id': Customer.objects.values_list('id', flat=True).first(),
+    }
+
+
+def run(names=None, repeat=5, log=print):
+    """Run the scenarios and return the report (a JSON-serialisable dict)."""
+    user = User.objects.filter(username=BENCH_USER).first()
+    if user is None or not Store.objects.filter(name__startswith=BENCH_STORE_PREFIX).exists():
+        raise ValueError("No benchmark data in this database; run `manage.py seed_bench` first.")
+    context = _context()
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+        client = Client()
+        client.force_login(user)
+        for name in names or SCENARIOS:
+            times = []
+            status = None
+            first = None
+            queries = 0
+            for n in range(repeat):
+                request = SCENARIOS[name](client, context)
+                connection.queries_log.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request()
+                    elapsed = (time.perf_counter() - started) * 1000
+                status = response.status_code
+                if status >= 400:
+                    raise ValueError(f"{name} answered {status}.")
+                queries = len(captured)
+                if first is None:
+                    first = elapsed
+                else:
+                    times.append(elapsed)
+
+            # Memory in a separate run: tracemalloc slows everything down
+            request = SCENARIOS[name](client, context)
+            tracemalloc.start()
+            try:
+                request()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            times = times or [first]
+            results[name] = {
+                'status': status,
+                'first_ms': round(first, 1),
+                'median_ms': round(statistics.median(times), 1),
+                'min_ms': round(min(times), 1),
+                'max_ms': round(max(times), 1),
+                'queries': queries,
+                'peak_kb': peak // 1024,
+            }
+            log(f"  {name}: {results[name]['median_ms']} ms, {queries} queries, {results[name]['peak_kb']} KiB")
+
+    return {
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'repeat': repeat,
+        'rows': {
+            'products': Product.objects.count(),
+            'stores': Store.objects.count(),
+            'stock_logs': StockLog.objects.count(),
+            'sales': Sale.objects.count(),
+        },
+        'scenarios': results,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Lines describing each scenario against the baseline, and the regressions among them:
+    a median time more than `tolerance` slower, or more queries."""
+    lines = []
+    regressions = []
+    for name, now in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            lines.append(f"{name}: no baseline")
+            continue
+        ratio = now['median_ms'] / before['median_ms'] if before['median_ms'] else 1
+        line = (f"{name}: {before['median_ms']} -> {now['median_ms']} ms ({ratio - 1:+.0%}), "
+                f"{before['queries']} -> {now['queries']} queries, {before['peak_kb']} -> {now['peak_kb']} KiB")
+        lines.append(line)
+        if ratio > 1 + tolerance or now['queries'] > before['queries']:
+            regressions.append(line)
+    return lines, regressions
@@ -0,0 +1,181 @@
+import uuid
+from collections import Counter
+
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Category, Store, Stock
+
+
+# Read-through cache with version-key invalidation. Every cached value is stored under
+# a key that embeds the current version token of the data it depends on:
+#   "catalog"        products and categories (not quantities)
+#   "categories"     category names alone (product row fragments)
+#   "stores"         the store list
+#   "stock:<id>"     one store's Stock rows
+# A write bumps the version (after its transaction commits), which makes every key built
+# on the old token unreachable; nothing is deleted, old entries just expire.
+# Versions live in the cache too, so all processes sharing the backend agree on them.
+
+stats = Counter()  # hits/misses in this process, see cache_stats()
+
+
+def _token():
+    return uuid.uuid4().hex[:12]
+
+
+def _version_key(name):
+    return f'ver:{name}'
+
+
+def versions(names):
+    """Current version token of each name, in one cache round trip."""
+    keys = {name: _version_key(name) for name in names}
+    found = cache.get_many(list(keys.values()))
+    for name, key in keys.items():
+        if key not in found:
+            # Never seen (or evicted): start a new version; add() keeps a concurrent winner
+            cache.add(key, _token(), None)
+            found[key] = cache.get(key)
+    return {name: found[key] for name, key in keys.items()}
+
+
+def bump(*names):
+    """Invalidate everything cached on `names` once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set_many({_version_key(name): _token() for name in names}, None))
+
+
+def get_many(specs):
+    """specs: {name: (depends_on, build)}. Returns {name: value}, building and storing only
+    what is missing. Two cache round trips however many entries are asked for."""
+    current = versions({dep for deps, _ in specs.values() for dep in deps})
+    keys = {name: name + ':' + ':'.join(current[dep] for dep in deps) for name, (deps, _) in specs.items()}
+    found = cache.get_many(list(keys.values()))
+    values = {}
+    built = {}
+    for name, key in keys.items():
+        if key in found:
+            stats['hits'] += 1
+            values[name] = found[key]
+        else:
+            stats['misses'] += 1
+            values[name] = built[key] = specs[name][1]()
+    if built:
+        cache.set_many(built)
+    return values
+
+
+def get(name, depends_on, build):
+    return get_many({name: (depends_on, build)})[name]
+
+
+def fragments(objects, key, render):
+    """Rendered fragment (e.g. a table row) for each object, in order. key(obj) must change
+    whenever the output would, so there is nothing to invalidate; all keys are fetched
+    with one get_many and only the missing fragments are rendered and stored."""
+    keys = [key(obj) for obj in objects]
+    found = cache.get_many(keys)
+    rendered = {}
+    out = []
+    for obj, k in zip(objects, keys):
+        if k in found:
+            stats['fragment_hits'] += 1
+            out.append(found[k])
+        else:
+            stats['fragment_misses'] += 1
+            html = rendered[k] = render(obj)
+            out.append(html)
+    if rendered:
+        cache.set_many(rendered)
+    return out
+
+
+def _rate(hits, misses):
+    return round(hits / (hits + misses), 3) if hits + misses else None
+
+
+def cache_stats():
+    return {
+        'backend': caches['default'].__class__.__name__,
+        'hits': stats['hits'],
+        'misses': stats['misses'],
+        'hit_rate': _rate(stats['hits'], stats['misses']),
+        'fragments': {
+            'hits': stats['fragment_hits'],
+            'misses': stats['fragment_misses'],
+            'hit_rate': _rate(stats['fragment_hits'], stats['fragment_misses']),
+        },
+    }
+
+
+# --- Cached reads -----------------------------------------------------------
+
+CATALOG_FIELDS = (
+    'id', 'code', 'name', 'category_id', 'purchase_price', 'selling_price',
+    'min_stock_alert', 'image', 'supplier_name', 'updated_at',
+)
+
+
+def _build_catalog():
+    return {
+        'products': list(Product.objects.order_by('id').values_list(*CATALOG_FIELDS)),
+        'categories': dict(Category.objects.values_list('id', 'name')),
+    }
+
+
+def store_list():
+    return get('stores', ['stores'], lambda: list(Store.objects.order_by('id')))
+
+
+def _stock_spec(store_id):
+    return [f'stock:{store_id}'], lambda: dict(
+        Stock.objects.filter(store_id=store_id).exclude(quantity=0).values_list('product_id', 'quantity')
+    )
+
+
+def store_stock(store_ids):
+    """{store_id: {product_id: quantity}} for the given stores."""
+    found = get_many({f'stock-{sid}': _stock_spec(sid) for sid in store_ids})
+    return {sid: found[f'stock-{sid}'] for sid in store_ids}
+
+
+def catalog_products():
+    """Every product (ordered by id) with its category and current global quantity,
+    without touching the database when nothing has changed."""
+    stores = store_list()
+    found = get_many({
+        'catalog': (['catalog'], _build_catalog),
+        **{f'stock-{s.id}': _stock_spec(s.id) for s in stores},
+    })
+    totals = Counter()
+    for s in stores:
+        totals.update(found[f'stock-{s.id}'])
+
+    categories = {cid: Category(id=cid, name=name) for cid, name in found['catalog']['categories'].items()}
+    products = []
+    for row in found['catalog']['products']:
+        product = Product(**dict(zip(CATALOG_FIELDS, row)), quantity=totals.get(row[0], 0))
+        product.category = categories.get(product.category_id)
+        products.append(product)
+    return products
+
+
+# --- Invalidation -----------------------------------------------------------
+# Model saves/deletes are caught by signals. Stock is only written in bulk
+# (inventory.stock, inventory.importers), which call bump() themselves.
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog(sender, **kwargs):
+    bump('catalog')
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, **kwargs):
+    bump('catalog', 'categories')
+
+
+@receiver([post_save, post_delete], sender=Store)
+def invalidate_stores(sender, instance, **kwargs):
+    bump('stores', f'stock:{instance.pk}')
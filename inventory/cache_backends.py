@@ -0,0 +1,22 @@
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class FileCache(FileBasedCache):
+    """FileBasedCache that culls once per set_many instead of once per key.
+
+    The stock backend lists the whole cache directory before every write, so storing
+    a few thousand row fragments in one call took tens of seconds."""
+
+    _culled = False
+
+    def _cull(self):
+        if not self._culled:
+            super()._cull()
+
+    def set_many(self, data, timeout=None, version=None):
+        self._cull()
+        self._culled = True
+        try:
+            return super().set_many(data, timeout, version)
+        finally:
+            self._culled = False
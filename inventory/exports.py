@@ -0,0 +1,157 @@
+import csv
+import tempfile
+from datetime import datetime
+from itertools import chain
+
+import openpyxl
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from .models import Product, Stock, Store, SaleItem, PurchaseItem, StockLog
+
+
+# Data exports for accounting. Rows come straight from values_list(...).iterator(), so no
+# model instances are built and memory stays flat however many rows there are. CSV is
+# streamed as it is produced; XLSX is written to a temporary file first (openpyxl can only
+# save a finished workbook) and that file is streamed.
+# Only the live tables are exported; archived months are already CSV files under
+# ARCHIVE_ROOT (see inventory.archive).
+
+XLSX_SHEET_ROWS = 1_000_000  # Excel stops at 1,048,576 rows per sheet
+XLSX_BLOCK_SIZE = 64 * 1024
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _chunk():
+    return settings.EXPORT_CHUNK_SIZE
+
+
+def _in_range(queryset, field, start, end, store_field=None, store_id=None):
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    if store_id and store_field:
+        queryset = queryset.filter(**{store_field: store_id})
+    return queryset
+
+
+def product_rows(start=None, end=None, store_id=None):
+    """Products with their total and one stock column per store. Products and Stock
+    rows are read in product order side by side, so only one product is held at a time."""
+    stores = list(Store.objects.order_by('name').values_list('id', 'name'))
+    if store_id:
+        stores = [s for s in stores if s[0] == int(store_id)]
+    column = {sid: i for i, (sid, _) in enumerate(stores)}
+    header = ['Code', 'Name', 'Category', 'Purchase Price', 'Selling Price', 'Total Quantity'] + [name for _, name in stores]
+
+    def rows():
+        stock = Stock.objects.filter(store_id__in=column).exclude(quantity=0).order_by('product_id').values_list(
+            'product_id', 'store_id', 'quantity').iterator(chunk_size=_chunk())
+        pending = next(stock, None)
+        for product_id, *values in Product.objects.order_by('id').values_list(
+            'id', 'code', 'name', 'category__name', 'purchase_price', 'selling_price', 'quantity',
+        ).iterator(chunk_size=_chunk()):
+            quantities = [0] * len(stores)
+            while pending is not None and pending[0] <= product_id:
+                if pending[0] == product_id:
+                    quantities[column[pending[1]]] = pending[2]
+                pending = next(stock, None)
+            yield values + quantities
+    return header, rows()
+
+
+def sale_rows(start=None, end=None, store_id=None):
+    """One row per sale line, with the sale's details repeated."""
+    header = ['Order', 'Date', 'Type', 'Store', 'Destination', 'Customer', 'Sales Person', 'User',
+              'Code', 'Product', 'Quantity', 'Unit Price', 'Subtotal', 'Order Total']
+    items = _in_range(SaleItem.objects.all(), 'sale__date', start, end, 'sale__source_store_id', store_id)
+    rows = items.order_by('sale_id', 'id').values_list(
+        'sale__order_id', 'sale__date', 'sale__is_transfer', 'sale__source_store__name',
+        'sale__destination_store__name', 'sale__customer__name', 'sale__sales_person__name', 'sale__user__username',
+        'product__code', 'product__name', 'quantity', 'unit_price', 'subtotal', 'sale__total_amount',
+    ).iterator(chunk_size=_chunk())
+    return header, (
+        (order, date, 'Transfer' if transfer else 'Sale', *rest)
+        for order, date, transfer, *rest in rows
+    )
+
+
+def purchase_rows(start=None, end=None, store_id=None):
+    """One row per purchase line, with the purchase's details repeated."""
+    header = ['Order', 'Date', 'Store', 'Supplier', 'User', 'Code', 'Product', 'Quantity', 'Unit Cost',
+              'Subtotal', 'Order Total']
+    items = _in_range(PurchaseItem.objects.all(), 'purchase__date', start, end, 'purchase__destination_store_id', store_id)
+    return header, items.order_by('purchase_id', 'id').values_list(
+        'purchase__order_id', 'purchase__date', 'purchase__destination_store__name', 'purchase__supplier',
+        'purchase__user__username', 'product__code', 'product__name', 'quantity', 'unit_cost', 'subtotal',
+        'purchase__total_amount',
+    ).iterator(chunk_size=_chunk())
+
+
+def stocklog_rows(start=None, end=None, store_id=None):
+    header = ['Time', 'Store', 'Code', 'Product', 'Action', 'Change', 'User', 'Reason']
+    logs = _in_range(StockLog.objects.all(), 'timestamp', start, end, 'store_id', store_id)
+    return header, logs.order_by('id').values_list(
+        'timestamp', 'store__name', 'product__code', 'product__name', 'action', 'quantity_change',
+        'user__username', 'reason',
+    ).iterator(chunk_size=_chunk())
+
+
+# kind -> (rows function, permission needed)
+EXPORTS = {
+    'products': (product_rows, 'inventory.view_product'),
+    'sales': (sale_rows, 'inventory.view_sale'),
+    'purchases': (purchase_rows, 'inventory.view_purchase'),
+    'stocklog': (stocklog_rows, 'inventory.view_stocklog'),
+}
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of storing it
+    def write(self, value):
+        return value
+
+
+def _local(value):
+    # Local wall-clock time; Excel has no time zones and openpyxl refuses aware datetimes
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+def csv_response(filename, header, rows):
+    writer = csv.writer(_Echo())
+    lines = (writer.writerow([_local(v) for v in row]) for row in chain([header], rows))
+    response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def _cell(value):
+    value = _local(value)
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub('', value)  # control characters are not allowed in XML
+    return value
+
+
+def xlsx_response(filename, header, rows, sheet_name='Sheet'):
+    # A write-only workbook keeps only the current row in memory and saves to a temporary
+    # file, which FileResponse then streams out in chunks and closes
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = None
+    for index, row in enumerate(rows):
+        if index % XLSX_SHEET_ROWS == 0:
+            sheet = workbook.create_sheet(f"{sheet_name[:25]} {index // XLSX_SHEET_ROWS + 1}")
+            sheet.append(header)
+        sheet.append([_cell(v) for v in row])
+    if sheet is None:
+        workbook.create_sheet(sheet_name[:30]).append(header)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    response = FileResponse(output, as_attachment=True, filename=f"{filename}.xlsx", content_type=XLSX_TYPE)
+    response.block_size = XLSX_BLOCK_SIZE
+    return response
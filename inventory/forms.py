@@ -76,6 +76,18 @@ class ProductForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Make quantity readonly as it's now aggregate
         self.fields['quantity'].help_text = "Global Total. To add stock, use 'Add Stock' page."
+        self.fields['quantity'].disabled = True
+
+    def save(self, commit=True):
+        product = super().save(commit=False)
+        if commit:
+            if product.pk:
+                # Never write back the loaded quantity, a sale may have moved it since
+                fields = [f for f in self._meta.fields if f != 'quantity']
+                product.save(update_fields=fields + ['updated_at'])
+            else:
+                product.save()
+        return product
 
 class CustomerForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,247 @@
+import codecs
+import csv
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from django.conf import settings
+from django.db import transaction
+
+from .cache import bump
+from .models import Product, Category, Stock, StockLog, StoreValuation, Customer, SalesPerson
+
+MAX_ERRORS = 1000
+
+
+def iter_rows(file, name=None):
+    """Yield data rows (header skipped) from a CSV or Excel upload without loading it whole."""
+    name = name or file.name
+    if name.endswith(('.xlsx', '.xls')):
+        wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            next(rows, None)
+            yield from rows
+        finally:
+            wb.close()
+    else:
+        reader = csv.reader(codecs.iterdecode(file, 'utf-8-sig'))
+        next(reader, None)
+        yield from reader
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value if value not in (None, '') else 0))
+    except InvalidOperation:
+        raise ValueError(f"Invalid price '{value}'")
+
+
+def _parse_product_row(row):
+    name = row[0]
+    code = str(row[1])
+    category_name = row[2]
+    p_price = _decimal(row[3]) if len(row) > 3 else 0
+    s_price = _decimal(row[4]) if len(row) > 4 else 0
+    qty = int(row[5] or 0) if len(row) > 5 else 0
+    min_alert = int(row[6] or 10) if len(row) > 6 else 10
+    if not name:
+        raise ValueError("Name is required")
+    if len(code) > Product._meta.get_field('code').max_length:
+        raise ValueError("Code is too long")
+    if qty < 0:
+        raise ValueError("Quantity cannot be negative")
+    return {
+        'name': name, 'code': code, 'category_name': str(category_name) if category_name else '',
+        'purchase_price': p_price, 'selling_price': s_price, 'quantity': qty, 'min_stock_alert': min_alert,
+    }
+
+
+def _save_products(parsed, categories, store, user):
+    """Insert one chunk of parsed rows: products, their Stock rows and StockLogs in bulk."""
+    missing = {r['category_name'] for r in parsed if r['category_name'] and r['category_name'] not in categories}
+    if missing:
+        Category.objects.bulk_create([Category(name=n) for n in missing], ignore_conflicts=True)
+        categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+
+    # Product.quantity is the maintained stock total, so it starts at the imported quantity
+    products = Product.objects.bulk_create([
+        Product(
+            name=r['name'], code=r['code'], category_id=categories.get(r['category_name']),
+            purchase_price=r['purchase_price'], selling_price=r['selling_price'],
+            quantity=r['quantity'], min_stock_alert=r['min_stock_alert'],
+        ) for r in parsed
+    ])
+    if products and products[0].pk is None:
+        # Backends that can't return ids from a bulk insert
+        ids = dict(Product.objects.filter(code__in=[p.code for p in products]).values_list('code', 'id'))
+        for p in products:
+            p.pk = ids[p.code]
+
+    stocked = [p for p in products if p.quantity > 0]
+    Stock.objects.bulk_create([Stock(store=store, product=p, quantity=p.quantity) for p in stocked])
+    StoreValuation.add({store.id: sum(p.quantity * p.purchase_price for p in stocked)})
+    bump('catalog', f'stock:{store.id}')  # bulk_create sends no signals
+    StockLog.objects.bulk_create([
+        StockLog(product=p, store=store, user=user, action='ADD', quantity_change=p.quantity, reason='Bulk Import')
+        for p in stocked
+    ])
+    return len(products)
+
+
+def import_products(file, user, store, name=None, chunk_size=None, progress=None):
+    """Stream a product file into the catalog in chunks. New products only (existing codes
+    are skipped); their quantity goes into `store`. Returns (created_count, errors).
+
+    `progress(rows, created_count, errors)` is called after every chunk."""
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    existing_codes = set(Product.objects.values_list('code', flat=True))
+    categories = dict(Category.objects.values_list('name', 'id'))
+    created_count = 0
+    errors = []
+
+    def add_error(msg):
+        if len(errors) < MAX_ERRORS:
+            errors.append(msg)
+
+    for chunk in _chunks(iter_rows(file, name), chunk_size):
+        parsed = []
+        for row in chunk:
+            try:
+                if not row or len(row) < 3: continue
+                r = _parse_product_row(row)
+                if r['code'] in existing_codes:
+                    continue
+                existing_codes.add(r['code'])
+                r['row'] = row
+                parsed.append(r)
+            except Exception as e:
+                add_error(f"Error row {row}: {str(e)}")
+
+        try:
+            with transaction.atomic():
+                created_count += _save_products(parsed, categories, store, user)
+        except Exception:
+            # Something in this chunk was rejected by the database: redo it row by row
+            # so only the offending rows are reported
+            categories.clear()
+            categories.update(Category.objects.values_list('name', 'id'))
+            for r in parsed:
+                try:
+                    with transaction.atomic():
+                        created_count += _save_products([r], categories, store, user)
+                except Exception as e:
+                    add_error(f"Error row {r['row']}: {str(e)}")
+
+        if progress:
+            progress(len(chunk), created_count, errors)
+
+    return created_count, errors
+
+
+def read_delivery_note(file, name=None):
+    """Purchase lines [(product_id, quantity, unit_cost)] from a delivery note, a CSV or
+    Excel file with columns code, quantity and (optional) unit cost; an empty cost keeps
+    the product's current purchase price. Product codes are resolved in one query.
+
+    Raises ValueError listing the bad rows; nothing is received unless every row is valid."""
+    parsed = []
+    errors = []
+    for number, row in enumerate(iter_rows(file, name), start=2):
+        if not row or not any(v not in (None, '') for v in row):
+            continue
+        try:
+            code = str(row[0] or '').strip()
+            if not code:
+                raise ValueError("Code is required")
+            try:
+                qty = int(row[1]) if len(row) > 1 else 0
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid quantity '{row[1]}'")
+            cost = _decimal(row[2]) if len(row) > 2 and row[2] not in (None, '') else None
+            parsed.append((number, code, qty, cost))
+        except ValueError as e:
+            errors.append((number, str(e)))
+
+    ids = dict(Product.objects.filter(code__in={code for _, code, _, _ in parsed}).values_list('code', 'id'))
+    lines = []
+    for number, code, qty, cost in parsed:
+        if code not in ids:
+            errors.append((number, f"Unknown product code '{code}'"))
+        elif qty <= 0:
+            errors.append((number, "Quantity must be positive"))
+        else:
+            lines.append((ids[code], qty, cost))
+    if errors:
+        shown = '; '.join(f"Row {number}: {msg}" for number, msg in sorted(errors)[:10])
+        raise ValueError(shown + (f" (and {len(errors) - 10} more)" if len(errors) > 10 else ''))
+    if not lines:
+        raise ValueError("The delivery note has no lines.")
+    return lines
+
+
+def _import_contacts(model, columns, file, name=None, chunk_size=None, progress=None):
+    """Shared loop for Customer/SalesPerson files: rows are `columns` in order, phone is
+    the unique key and existing phones are skipped."""
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    existing_phones = set(model.objects.values_list('phone', flat=True))
+    created_count = 0
+    errors = []
+
+    for chunk in _chunks(iter_rows(file, name), chunk_size):
+        objs = []
+        for row in chunk:
+            try:
+                if not row or len(row) < 2: continue
+                values = {col: (str(row[i]).strip() if i < len(row) and row[i] is not None else '')
+                          for i, col in enumerate(columns)}
+                if not values['name'] or not values['phone']:
+                    raise ValueError("Name and Phone are required")
+                if values['phone'] in existing_phones:
+                    continue
+                existing_phones.add(values['phone'])
+                if 'email' in values:
+                    values['email'] = values['email'] or None
+                obj = model(**values)
+                obj.full_clean(validate_unique=False)
+                objs.append((row, obj))
+            except Exception as e:
+                if len(errors) < MAX_ERRORS:
+                    errors.append(f"Error row {row}: {str(e)}")
+
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([obj for _, obj in objs])
+            created_count += len(objs)
+        except Exception:
+            for row, obj in objs:
+                try:
+                    with transaction.atomic():
+                        obj.save()
+                    created_count += 1
+                except Exception as e:
+                    if len(errors) < MAX_ERRORS:
+                        errors.append(f"Error row {row}: {str(e)}")
+
+        if progress:
+            progress(len(chunk), created_count, errors)
+
+    return created_count, errors
+
+
+def import_customers(file, name=None, chunk_size=None, progress=None):
+    return _import_contacts(Customer, ['name', 'phone', 'address', 'email'], file, name, chunk_size, progress)
+
+
+def import_salespeople(file, name=None, chunk_size=None, progress=None):
+    return _import_contacts(SalesPerson, ['name', 'phone', 'email'], file, name, chunk_size, progress)
@@ -0,0 +1,83 @@
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .importers import import_products, import_customers, import_salespeople, MAX_ERRORS
+from .models import ImportJob
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale():
+    """Put RUNNING jobs whose worker stopped reporting back in the queue. Imports skip
+    rows that already exist, so re-running a half-done file is safe."""
+    cutoff = timezone.now() - timedelta(minutes=settings.IMPORT_JOB_STALE_MINUTES)
+    return ImportJob.objects.filter(status='RUNNING', heartbeat__lt=cutoff).update(status='PENDING', worker='')
+
+
+def claim_next(worker):
+    """Atomically take the oldest pending job. The conditional UPDATE only succeeds for one
+    worker, so this is safe across processes and backends without row locks."""
+    while True:
+        job_id = ImportJob.objects.filter(status='PENDING').order_by('created_at', 'id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(id=job_id, status='PENDING').update(
+            status='RUNNING', worker=worker, started_at=now, heartbeat=now,
+            rows_processed=0, created_count=0, error_count=0, errors=[],
+        )
+        if claimed:
+            return ImportJob.objects.get(id=job_id)
+
+
+def run_job(job):
+    def progress(rows, created_count, errors):
+        ImportJob.objects.filter(pk=job.pk).update(
+            rows_processed=F('rows_processed') + rows,
+            created_count=created_count,
+            error_count=len(errors),
+            heartbeat=timezone.now(),
+        )
+
+    try:
+        with job.file.open('rb') as f:
+            if job.kind == 'products':
+                created_count, errors = import_products(f, job.user, job.store, name=job.original_name, progress=progress)
+            elif job.kind == 'customers':
+                created_count, errors = import_customers(f, name=job.original_name, progress=progress)
+            elif job.kind == 'salespeople':
+                created_count, errors = import_salespeople(f, name=job.original_name, progress=progress)
+            else:
+                raise ValueError(f"Unknown import kind '{job.kind}'")
+    except Exception as e:
+        ImportJob.objects.filter(pk=job.pk).update(
+            status='FAILED', errors=[f"Critical Error: {str(e)}"], error_count=F('error_count') + 1,
+            finished_at=timezone.now(),
+        )
+        discard_upload(job)
+        return
+
+    ImportJob.objects.filter(pk=job.pk).update(
+        status='DONE', created_count=created_count, error_count=len(errors),
+        errors=errors[:MAX_ERRORS], finished_at=timezone.now(),
+    )
+    discard_upload(job)
+
+
+def discard_upload(job):
+    # A finished job keeps its counts and errors; the uploaded file is no longer needed
+    name = job.file.name
+    if not name:
+        return
+    try:
+        job.file.storage.delete(name)
+    except OSError:
+        return  # left for a later cleanup rather than failing the job
+    ImportJob.objects.filter(pk=job.pk).update(file='')
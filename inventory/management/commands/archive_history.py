@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from inventory.archive import archive_month, months_to_archive
+
+
+class Command(BaseCommand):
+    help = "Move StockLog and Sale history older than a cutoff into monthly gzip'd CSV archives."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help="Cutoff date (YYYY-MM-DD); only whole months before it are archived. "
+                                             "Default: ARCHIVE_AFTER_DAYS ago.")
+        parser.add_argument('--only', choices=['stocklog', 'sales'], help="Archive only this kind of history.")
+        parser.add_argument('--dry-run', action='store_true', help="List the months that would be archived.")
+
+    def handle(self, *args, **options):
+        if options['before']:
+            before = parse_date(options['before'])
+            if before is None:
+                raise CommandError(f"Invalid date '{options['before']}', expected YYYY-MM-DD.")
+        else:
+            before = timezone.localdate() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+
+        kinds = [options['only']] if options['only'] else ['stocklog', 'sales']
+        for kind in kinds:
+            for month in months_to_archive(kind, before):
+                if options['dry_run']:
+                    self.stdout.write(f"{kind} {month:%Y-%m}")
+                    continue
+                for segment in archive_month(month, kind):
+                    self.stdout.write(f"{segment.kind} {month:%Y-%m}: {segment.rows} rows -> {segment.path}")
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Archived history before {before:%Y-%m}-01."))
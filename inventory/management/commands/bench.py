@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.bench import SCENARIOS, compare, run
+
+
+class Command(BaseCommand):
+    help = ("Time the hot pages (wall time, queries, peak memory) through the test client and "
+            "write a JSON report, optionally compared with a baseline report. Checkout writes "
+            "sales, so it only runs where `seed_bench` has created the bench user and stores.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=list(SCENARIOS), help="Scenarios to run (default all).")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per scenario; the first is reported separately as cold.")
+        parser.add_argument('--output', default='bench.json', help="Where to write the report.")
+        parser.add_argument('--baseline', help="Earlier report to compare with; regressions fail the command.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed median slowdown against the baseline (0.2 = 20%%).")
+
+    def handle(self, *args, **options):
+        try:
+            report = run(options['only'], repeat=max(2, options['repeat']), log=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Report written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            lines, regressions = compare(report, baseline, options['tolerance'])
+            for line in lines:
+                self.stdout.write(line)
+            if regressions:
+                raise CommandError(f"{len(regressions)} scenario(s) regressed against {options['baseline']}.")
+            self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.models import UserPresence
+
+
+class Command(BaseCommand):
+    help = "Delete presence rows for users not seen recently."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=None,
+                            help="Age cutoff in minutes (default: 4 x ACTIVE_USER_MINUTES).")
+
+    def handle(self, *args, **options):
+        minutes = options['minutes'] or settings.ACTIVE_USER_MINUTES * 4
+        cutoff = timezone.now() - timedelta(minutes=minutes)
+        deleted, _ = UserPresence.objects.filter(last_seen__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} stale presence row(s)."))
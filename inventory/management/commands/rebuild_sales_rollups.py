@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from inventory.reports import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Regenerate the daily sales rollups used by reports from the raw sales."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help="First date to rebuild (YYYY-MM-DD). Default: earliest.")
+        parser.add_argument('--to', dest='end', help="Last date to rebuild (YYYY-MM-DD). Default: latest.")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for opt in ('start', 'end'):
+            value = options[opt]
+            dates[opt] = parse_date(value) if value else None
+            if value and dates[opt] is None:
+                raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+        if dates['start'] and dates['end'] and dates['start'] > dates['end']:
+            raise CommandError("--from is after --to.")
+
+        written = rebuild_rollups(**dates)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup row(s)."))
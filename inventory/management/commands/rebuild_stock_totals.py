@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.stock import recompute_totals, mismatched_totals
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.quantity (global stock total) from the per-store Stock rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report products whose total is out of sync.")
+
+    def handle(self, *args, **options):
+        drifted = mismatched_totals()
+        count = drifted.count()
+
+        if options['check']:
+            for p in drifted[:50]:
+                self.stdout.write(f"{p.code}: stored {p.quantity}, stock rows {p.stock_sum}")
+            self.stdout.write(f"{count} product(s) out of sync.")
+            return
+
+        with transaction.atomic():
+            updated = recompute_totals()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed totals for {updated} products ({count} were out of sync)."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.stock import mismatched_valuations, rebuild_valuations
+
+
+class Command(BaseCommand):
+    help = "Verify or rebuild the stored per-store stock valuation (quantity x purchase price)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report stores whose stored value is wrong.")
+
+    def handle(self, *args, **options):
+        drifted = mismatched_valuations()
+
+        if options['check']:
+            for store, stored, computed in drifted:
+                self.stdout.write(f"{store.name}: stored {stored}, computed {computed}")
+            self.stdout.write(f"{len(drifted)} store(s) out of sync.")
+            return
+
+        with transaction.atomic():
+            count = rebuild_valuations()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt valuations for {count} stores ({len(drifted)} were out of sync)."))
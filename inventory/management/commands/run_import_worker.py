@@ -0,0 +1,55 @@
+# Deployment: uploads are saved under the web host's MEDIA_ROOT, so the worker has to run
+# on the same machine as the web server. The Railway start command (railway.json) and the
+# Procfile web line launch it in the background before gunicorn, restarting it if it
+# exits; safe_start_server.bat opens it in its own window. A worker on another host (a
+# separate Procfile process or Railway service) would not see the files and every
+# ImportJob would stay PENDING.
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def work(poll, once):
+    # Runs in each worker process; Django is already configured when forked,
+    # spawned processes (Windows) set it up again here.
+    import django
+    django.setup()
+    from inventory.jobs import worker_name, requeue_stale, claim_next, run_job
+
+    name = worker_name()
+    while True:
+        requeue_stale()
+        job = claim_next(name)
+        if job is not None:
+            run_job(job)
+            continue
+        if once:
+            return
+        connections.close_all()
+        time.sleep(poll)
+
+
+class Command(BaseCommand):
+    help = "Process queued ImportJobs (product/customer/sales person uploads)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Number of worker processes.")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        poll, once, processes = options['poll'], options['once'], max(1, options['processes'])
+        if processes == 1:
+            work(poll, once)
+            return
+
+        # Children must not share the parent's DB connections
+        connections.close_all()
+        workers = [multiprocessing.Process(target=work, args=(poll, once)) for _ in range(processes)]
+        for p in workers:
+            p.start()
+        self.stdout.write(f"Started {processes} import workers.")
+        for p in workers:
+            p.join()
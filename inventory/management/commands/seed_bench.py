@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory.bench import SIZES, seed
+from inventory.models import Product
+
+
+class Command(BaseCommand):
+    help = ("Fill an empty database with a seeded benchmark dataset (default 50k products, "
+            "30 stores, 5M stock logs) for `manage.py bench`.")
+
+    def add_arguments(self, parser):
+        for name, default in SIZES.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default, dest=name,
+                                help=f"Rows to create (default {default:,}).")
+        parser.add_argument('--scale', type=float, default=1.0, help="Multiply every size, e.g. 0.01 for a quick run.")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--days', type=int, default=365, help="Days of history to spread dates over.")
+        parser.add_argument('--password', help="Password for the `bench` user (default: none, it can't log in).")
+        parser.add_argument('--force', action='store_true', help="Add the data even if the database has products.")
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() and not options['force']:
+            raise CommandError("The database already has products; use an empty database or --force.")
+        # Stores don't scale: the point of a small run is fewer rows per store, not fewer stores
+        sizes = {name: options[name] if name == 'stores' else max(1, int(options[name] * options['scale'])) for name in SIZES}
+        self.stdout.write("Generating: " + ", ".join(f"{n} {name}" for name, n in sizes.items()))
+        started = time.monotonic()
+        with transaction.atomic():
+            created = seed(sizes, seed=options['seed'], days=options['days'], log=self.stdout.write,
+                           password=options['password'])
+        login = "Log in as bench with the given password." if options['password'] else "The bench user has no password."
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {sum(created.values())} rows in {time.monotonic() - started:.0f}s. {login}"
+        ))
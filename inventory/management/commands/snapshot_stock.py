@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory.snapshots import take_snapshot, prune_snapshots
+
+
+class Command(BaseCommand):
+    help = ("Checkpoint every store's stock for point-in-time queries. Run it nightly "
+            "(cron / scheduled task); older snapshots are thinned to one per month.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-daily', type=int, default=None,
+                            help="Days of daily snapshots to keep (default: STOCK_SNAPSHOT_DAILY_DAYS).")
+
+    def handle(self, *args, **options):
+        written = take_snapshot()
+        days = options['keep_daily'] or settings.STOCK_SNAPSHOT_DAILY_DAYS
+        pruned = prune_snapshots(days)
+        self.stdout.write(self.style.SUCCESS(f"Snapshot of {written} stock row(s) taken, {pruned} old row(s) pruned."))
@@ -0,0 +1,215 @@
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from .models import UserPresence, RequestProfile
+
+
+class PresenceMiddleware:
+    """Record a last-seen timestamp per user, throttled through the cache so
+    at most one UPDATE per user per PRESENCE_INTERVAL seconds reaches the DB."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = getattr(settings, 'PRESENCE_INTERVAL', 60)
+
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            # cache.add only succeeds when the key is absent, i.e. once per interval
+            if cache.add(f'presence:{user.pk}', 1, self.interval):
+                now = timezone.now()
+                if not UserPresence.objects.filter(user_id=user.pk).update(last_seen=now):
+                    UserPresence.objects.get_or_create(user_id=user.pk, defaults={'last_seen': now})
+        return self.get_response(request)
+
+
+logger = logging.getLogger('inventory.performance')
+
+# Timings of the request being handled (None outside QueryBudgetMiddleware)
+_timings = ContextVar('inventory_request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.rendering = 0  # nesting depth, so a template rendered inside another counts once
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: time every query
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+@contextmanager
+def timed_rendering():
+    """Count the time inside as template rendering of the current request (used by
+    inventory.template_backends). Does nothing outside QueryBudgetMiddleware."""
+    timings = _timings.get()
+    if timings is None or timings.rendering:
+        yield
+        return
+    timings.rendering += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.render += time.perf_counter() - started
+        timings.rendering -= 1
+
+
+class QueryBudgetMiddleware:
+    """Count the queries and database time of every request and report them in a
+    Server-Timing header (db, render, total), so they show in the browser's network
+    panel without DEBUG. A request over its query budget (QUERY_BUDGETS by URL name,
+    else QUERY_BUDGET_DEFAULT) is logged as a warning on `inventory.performance`, with
+    the most repeated statement, which is usually the N+1.
+
+    Render time covers Django template rendering, including queries run from templates
+    (db time counts those queries too). It is measured by the template backend in
+    inventory.template_backends, so it stays 0 if TEMPLATES uses another backend."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.default_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        self.header = getattr(settings, 'SERVER_TIMING', True)
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        total = time.perf_counter() - timings.started
+
+        if self.header:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"',
+                f'render;dur={timings.render * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else None
+        budget = self.budgets.get(name, self.default_budget)
+        if budget is not None and timings.queries > budget:
+            sql, repeats = timings.statements.most_common(1)[0]
+            details = {
+                'url_name': name, 'path': request.path, 'method': request.method,
+                'status': response.status_code, 'queries': timings.queries, 'budget': budget,
+                'db_ms': round(timings.db * 1000, 1), 'total_ms': round(total * 1000, 1),
+                # Only interesting when repeated (a statement run once per row)
+                'top_statement': sql[:300] if repeats > 1 else None, 'top_statement_count': repeats,
+            }
+            logger.warning("Query budget exceeded: %s", json.dumps(details), extra={'query_budget': details})
+        return response
+
+
+class ProfilerMiddleware:
+    """Profile a request's view (and the rendering of a lazy TemplateResponse, such as
+    DRF's) with cProfile and store the result as a RequestProfile, downloadable from
+    the admin. A request is profiled when:
+      - a superuser asks for it with ?profile=1 or an `X-Profile: 1` header (the response
+        then carries X-Profile-Id), or
+      - its URL name is in PROFILE_SAMPLE_RATES and it wins the draw (any user).
+    Must come last in MIDDLEWARE: profiling starts in process_view, after the other
+    middleware's process_view hooks (CSRF) have run, and stops when the response gets
+    back to __call__, so the view runs (and fails) through Django's normal handling.
+    When neither applies it does nothing but a dict lookup."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rates = getattr(settings, 'PROFILE_SAMPLE_RATES', {})
+        self.keep = getattr(settings, 'PROFILE_KEEP', 200)
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            # View exceptions come back as 500 responses (and are profiled); anything
+            # that still escapes only needs the profiler stopped
+            profiling = getattr(request, '_profiler', None)
+            if profiling is not None:
+                profiling[0].disable()
+        if profiling is None:
+            return response
+        profiler, reason, started, queries_before = profiling
+        duration = (time.perf_counter() - started) * 1000
+        timings = _timings.get()
+        profile = self._save(request, reason, response, duration, profiler,
+                             timings.queries - queries_before if timings else None)
+        if reason == 'requested':
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    def _reason(self, request):
+        if request.GET.get('profile') == '1' or request.headers.get('X-Profile') == '1':
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_superuser:
+                return 'requested'
+        rate = self.rates.get(request.resolver_match.view_name)
+        if rate and random.random() < rate:
+            return 'sampled'
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        reason = self._reason(request)
+        if reason is None:
+            return None
+
+        timings = _timings.get()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process: skip this one
+            return None
+        request._profiler = (profiler, reason, time.perf_counter(), timings.queries if timings else None)
+        return None
+
+    def _save(self, request, reason, response, duration, profiler, queries):
+        stats = pstats.Stats(profiler)
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(40)
+        user = getattr(request, 'user', None)
+        profile = RequestProfile.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            method=request.method, path=request.path[:255],
+            query_string=request.META.get('QUERY_STRING', ''),
+            url_name=(request.resolver_match.view_name or '')[:100], reason=reason,
+            status_code=response.status_code, duration_ms=duration, queries=queries,
+            summary=summary.getvalue(), stats=marshal.dumps(stats.stats),
+        )
+        # Keep only the newest PROFILE_KEEP profiles
+        stale = RequestProfile.objects.order_by('-created_at', '-id').values_list('id', flat=True)[self.keep:self.keep + 100]
+        if stale:
+            RequestProfile.objects.filter(id__in=list(stale)).delete()
+        return profile
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('inventory', '0007_store_sale_is_transfer_alter_product_quantity_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPresence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='presence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_seen', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
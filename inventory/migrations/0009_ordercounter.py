@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    Sale = apps.get_model('inventory', 'Sale')
+    Purchase = apps.get_model('inventory', 'Purchase')
+    OrderCounter = apps.get_model('inventory', 'OrderCounter')
+
+    for prefix, model in (('SO-', Sale), ('TR-', Sale), ('PO-', Purchase)):
+        highest = 0
+        for order_id in model.objects.filter(order_id__startswith=prefix).values_list('order_id', flat=True).iterator():
+            try:
+                highest = max(highest, int(order_id[len(prefix):]))
+            except ValueError:
+                pass
+        OrderCounter.objects.update_or_create(prefix=prefix, defaults={'last_value': highest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_userpresence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCounter',
+            fields=[
+                ('prefix', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
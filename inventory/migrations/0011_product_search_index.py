@@ -0,0 +1,65 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS inventory_product_fts USING fts5(
+        name, code, content='inventory_product', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS inventory_product_fts_ai AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(rowid, name, code) VALUES (new.id, new.name, new.code);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS inventory_product_fts_ad AFTER DELETE ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, name, code) VALUES ('delete', old.id, old.name, old.code);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS inventory_product_fts_au AFTER UPDATE OF name, code ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, name, code) VALUES ('delete', old.id, old.name, old.code);
+        INSERT INTO inventory_product_fts(rowid, name, code) VALUES (new.id, new.name, new.code);
+    END""",
+    "INSERT INTO inventory_product_fts(inventory_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS inventory_product_fts_ai",
+    "DROP TRIGGER IF EXISTS inventory_product_fts_ad",
+    "DROP TRIGGER IF EXISTS inventory_product_fts_au",
+    "DROP TABLE IF EXISTS inventory_product_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS inventory_product_name_trgm ON inventory_product USING gin (UPPER(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS inventory_product_code_trgm ON inventory_product USING gin (UPPER(code) gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS inventory_product_name_trgm",
+    "DROP INDEX IF EXISTS inventory_product_code_trgm",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        connection = schema_editor.connection
+        statements = statements_by_vendor.get(connection.vendor, [])
+        if connection.vendor == 'sqlite':
+            import sqlite3
+            if sqlite3.sqlite_version_info < (3, 34, 0):
+                # No trigram tokenizer; search falls back to icontains
+                return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_importjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
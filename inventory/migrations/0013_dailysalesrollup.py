@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    # Same aggregation as inventory.reports.rebuild_rollups, on the historical models
+    Sale = apps.get_model('inventory', 'Sale')
+    SaleItem = apps.get_model('inventory', 'SaleItem')
+    DailySalesRollup = apps.get_model('inventory', 'DailySalesRollup')
+
+    quantities = {}
+    for row in SaleItem.objects.annotate(day=TruncDate('sale__date')).values(
+        'day', 'sale__source_store', 'sale__is_transfer', 'sale__sales_person'
+    ).annotate(quantity=Sum('quantity')).order_by():
+        quantities[(row['day'], row['sale__source_store'], row['sale__is_transfer'], row['sale__sales_person'])] = row['quantity']
+
+    totals = Sale.objects.annotate(day=TruncDate('date')).values(
+        'day', 'source_store', 'is_transfer', 'sales_person'
+    ).annotate(revenue=Sum('total_amount'), orders=Count('id')).order_by()
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            date=row['day'], store_id=row['source_store'], is_transfer=row['is_transfer'],
+            sales_person_id=row['sales_person'], revenue=row['revenue'], orders=row['orders'],
+            items=quantities.get((row['day'], row['source_store'], row['is_transfer'], row['sales_person']), 0),
+        ) for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_product_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('is_transfer', models.BooleanField(default=False)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('items', models.IntegerField(default=0)),
+                ('sales_person', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='inventory.salesperson')),
+                ('store', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='inventory.store')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'store', 'is_transfer', 'sales_person'), name='unique_daily_sales_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
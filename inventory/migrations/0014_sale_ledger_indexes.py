@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_dailysalesrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date', 'id'], name='inventory_s_date_ca780e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['is_transfer', 'date', 'id'], name='inventory_s_is_tran_e592b9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['source_store', 'date', 'id'], name='inventory_s_source__3545ed_idx'),
+        ),
+    ]
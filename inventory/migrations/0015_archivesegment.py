@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_sale_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('stocklog', 'Stock Log'), ('sale', 'Sale'), ('saleitem', 'Sale Item')], max_length=20)),
+                ('month', models.DateField(help_text='First day of the archived month (local time)')),
+                ('path', models.CharField(help_text='Relative to ARCHIVE_ROOT', max_length=255)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('first_id', models.PositiveBigIntegerField(null=True)),
+                ('last_id', models.PositiveBigIntegerField(null=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'month'], name='inventory_a_kind_4a1dcb_idx')],
+            },
+        ),
+    ]
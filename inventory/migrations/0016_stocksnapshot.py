@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_archivesegment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('as_of', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stocklog',
+            index=models.Index(fields=['store', 'timestamp'], name='inventory_s_store_i_acfd9b_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.product'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.store'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('store', 'as_of', 'product'), name='unique_stock_snapshot'),
+        ),
+    ]
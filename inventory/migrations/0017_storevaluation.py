@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def seed_valuations(apps, schema_editor):
+    Store = apps.get_model('inventory', 'Store')
+    Stock = apps.get_model('inventory', 'Stock')
+    StoreValuation = apps.get_model('inventory', 'StoreValuation')
+
+    values = dict(Stock.objects.values('store_id').annotate(
+        value=Sum(F('quantity') * F('product__purchase_price'), output_field=models.DecimalField(max_digits=16, decimal_places=2))
+    ).order_by().values_list('store_id', 'value'))
+    StoreValuation.objects.bulk_create([
+        StoreValuation(store_id=store_id, value=values.get(store_id) or 0)
+        for store_id in Store.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreValuation',
+            fields=[
+                ('store', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='valuation', serialize=False, to='inventory.store')),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_valuations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_storevaluation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncedSale',
+            fields=[
+                ('key', models.UUIDField(primary_key=True, serialize=False)),
+                ('terminal', models.CharField(blank=True, max_length=50)),
+                ('order_id', models.CharField(max_length=20)),
+                ('synced_at', models.DateTimeField(auto_now_add=True)),
+                ('sale', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.sale')),
+            ],
+        ),
+    ]
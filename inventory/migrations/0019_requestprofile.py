@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_syncedsale'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('query_string', models.TextField(blank=True)),
+                ('url_name', models.CharField(blank=True, max_length=100)),
+                ('reason', models.CharField(choices=[('requested', 'Requested'), ('sampled', 'Sampled')], max_length=20)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('queries', models.PositiveIntegerField(blank=True, null=True)),
+                ('summary', models.TextField(blank=True, help_text='Top functions by cumulative time')),
+                ('stats', models.BinaryField(help_text='pstats dump (marshal), as written by Stats.dump_stats')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='inventory_r_created_14be75_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    # Checkouts could create several rows for the same key when store or sales person
+    # was NULL; fold them into the oldest row before the constraints go on
+    DailySalesRollup = apps.get_model('inventory', 'DailySalesRollup')
+    key = ('date', 'store', 'is_transfer', 'sales_person')
+    groups = DailySalesRollup.objects.values(*key).annotate(
+        rows=Count('id'), keep=Min('id'), revenue_sum=Sum('revenue'), orders_sum=Sum('orders'), items_sum=Sum('items'),
+    ).filter(rows__gt=1).order_by()
+    for group in groups:
+        DailySalesRollup.objects.filter(id=group['keep']).update(
+            revenue=group['revenue_sum'], orders=group['orders_sum'], items=group['items_sum'],
+        )
+        DailySalesRollup.objects.filter(**{f: group[f] for f in key}).exclude(id=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_requestprofile'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('sales_person__isnull', True)), fields=('date', 'store', 'is_transfer'), name='unique_daily_sales_rollup_no_person'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('store__isnull', True)), fields=('date', 'is_transfer', 'sales_person'), name='unique_daily_sales_rollup_no_store'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('sales_person__isnull', True), ('store__isnull', True)), fields=('date', 'is_transfer'), name='unique_daily_sales_rollup_no_store_person'),
+        ),
+    ]
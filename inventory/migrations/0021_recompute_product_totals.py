@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def recompute_totals(apps, schema_editor):
+    # Product.quantity is maintained by deltas from here on, so it has to start out as
+    # the sum of the Stock rows (older imports and edits left it at whatever they wrote)
+    Product = apps.get_model('inventory', 'Product')
+    Stock = apps.get_model('inventory', 'Stock')
+    totals = Stock.objects.filter(product=OuterRef('pk')).values('product').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    Product.objects.update(quantity=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_dailysalesrollup_null_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_totals, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
 from django.dispatch import receiver
 
 class Store(models.Model):
@@ -28,9 +33,9 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
-    # Global quantity is now sum of Stock, but kept for legacy/cache compatibility temporarily
-    # Ideally should be removed or made a property. We will use a property in views.
-    quantity = models.IntegerField(default=0, help_text="Global total quantity") 
+    # Global quantity is the sum of Stock over all stores, maintained by inventory.stock helpers
+    # in the same transaction as every Stock change. Repair with `manage.py rebuild_stock_totals`.
+    quantity = models.IntegerField(default=0, help_text="Global total quantity")
     min_stock_alert = models.IntegerField(default=10, help_text="Alert when stock falls below this level")
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
@@ -38,12 +43,35 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['updated_at', 'id'])]  # API keyset pagination
+
     def __str__(self):
         return f"{self.name} ({self.code})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored cost so save() can revalue stock when it changes
+        instance._saved_purchase_price = instance.__dict__.get('purchase_price')
+        return instance
+
+    def save(self, *args, **kwargs):
+        old_price = getattr(self, '_saved_purchase_price', None)
+        update_fields = kwargs.get('update_fields')
+        new_price = Decimal(str(self.purchase_price))
+        price_saved = update_fields is None or 'purchase_price' in update_fields
+        revalue = self.pk is not None and old_price is not None and price_saved and new_price != old_price
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if revalue:
+                StoreValuation.revalue_product(self.pk, new_price - old_price)
+        if price_saved:
+            self._saved_purchase_price = new_price
+
     @property
     def total_stock(self):
-        return self.stocks.aggregate(total=models.Sum('quantity'))['total'] or 0
+        return self.quantity
 
     @property
     def is_low_stock(self):
@@ -60,6 +88,71 @@ class Stock(models.Model):
     def __str__(self):
         return f"{self.store.name} - {self.product.name}: {self.quantity}"
 
+class StoreValuation(models.Model):
+    # Value of a store's stock at purchase price (sum of Stock.quantity * purchase_price),
+    # kept up to date in the same transaction as every stock movement and cost change
+    # (inventory.stock.apply_stock_changes, Product.save). Check or repair it with
+    # `manage.py rebuild_stock_valuation`.
+    store = models.OneToOneField(Store, on_delete=models.CASCADE, primary_key=True, related_name='valuation')
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.store_id}: {self.value}"
+
+    @classmethod
+    def add(cls, amounts):
+        """Add {store_id: amount} to the stored valuations, creating missing rows."""
+        amounts = {store_id: amount for store_id, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        with transaction.atomic():
+            if len(amounts) > 1:
+                # Lock in a fixed order so concurrent transfers can't deadlock
+                list(cls.objects.select_for_update().filter(store_id__in=amounts).order_by('store_id').values_list('pk'))
+            increment = models.Case(
+                *[models.When(store_id=store_id, then=models.Value(amount)) for store_id, amount in amounts.items()],
+                default=models.Value(0), output_field=models.DecimalField(max_digits=16, decimal_places=2),
+            )
+            updated = cls.objects.filter(store_id__in=amounts).update(value=models.F('value') + increment, updated_at=timezone.now())
+            if updated == len(amounts):
+                return
+            existing = set(cls.objects.filter(store_id__in=amounts).values_list('store_id', flat=True))
+            for store_id in set(amounts) - existing:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(store_id=store_id, value=amounts[store_id])
+                except IntegrityError:
+                    # Another transaction created it first
+                    cls.objects.filter(store_id=store_id).update(value=models.F('value') + amounts[store_id])
+
+    @classmethod
+    def revalue_product(cls, product_id, price_change):
+        """Reprice every store's holding of a product by `price_change` per unit."""
+        cls.revalue_products({product_id: price_change})
+
+    @classmethod
+    def revalue_products(cls, price_changes):
+        """revalue_product for {product_id: price_change}, reading the Stock rows once."""
+        price_changes = {pk: change for pk, change in price_changes.items() if change}
+        if not price_changes:
+            return
+        amounts = defaultdict(Decimal)
+        for store_id, product_id, quantity in Stock.objects.filter(
+            product_id__in=price_changes
+        ).exclude(quantity=0).values_list('store_id', 'product_id', 'quantity'):
+            amounts[store_id] += quantity * price_changes[product_id]
+        cls.add(amounts)
+
+@receiver(pre_delete, sender=Product)
+def remove_product_value(sender, instance, **kwargs):
+    # The product's Stock rows go with it (CASCADE), and so does their value
+    price = Decimal(str(instance.purchase_price))
+    StoreValuation.add({
+        store_id: -quantity * price
+        for store_id, quantity in Stock.objects.filter(product_id=instance.pk).exclude(quantity=0).values_list('store_id', 'quantity')
+    })
+
 class Customer(models.Model):
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=20, unique=True)
@@ -79,6 +172,21 @@ class SalesPerson(models.Model):
     def __str__(self):
         return self.name
 
+class UserPresence(models.Model):
+    # Last time a logged-in user hit the site. Written by PresenceMiddleware at most
+    # once per PRESENCE_INTERVAL, read by the dashboard's active user count.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='presence')
+    last_seen = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.last_seen}"
+
+@receiver(user_logged_out)
+def clear_presence(sender, request, user, **kwargs):
+    if user is not None:
+        UserPresence.objects.filter(user_id=user.pk).delete()
+        cache.delete(f'presence:{user.pk}')
+
 class StockLog(models.Model):
     ACTION_CHOICES = [
         ('ADD', 'Stock Added'),
@@ -97,9 +205,68 @@ class StockLog(models.Model):
     reason = models.CharField(max_length=255, blank=True)
     timestamp = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [models.Index(fields=['store', 'timestamp'])]  # point-in-time stock deltas
+
     def __str__(self):
         return f"{self.product.code} - {self.action} ({self.quantity_change})"
 
+class StockSnapshot(models.Model):
+    # Checkpoint of Stock taken by `snapshot_stock` (nightly). Stock at any moment is the
+    # nearest checkpoint plus/minus the StockLog changes in between (inventory.snapshots).
+    # Zero quantities are not stored: a product missing from a snapshot had none.
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='snapshots')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField()
+    as_of = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'as_of', 'product'], name='unique_stock_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id}/{self.product_id} @ {self.as_of}: {self.quantity}"
+
+class OrderCounter(models.Model):
+    # One row per order number prefix (SO-, TR-, PO-). Numbers are handed out by
+    # incrementing the row inside a transaction, so concurrent checkouts never collide.
+    prefix = models.CharField(max_length=10, primary_key=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefix}{self.last_value}"
+
+    @classmethod
+    def reserve(cls, prefix, count=1):
+        """Reserve `count` consecutive order numbers and return them as strings."""
+        with transaction.atomic():
+            # The UPDATE takes the row lock, which is held until the outer transaction ends
+            if not cls.objects.filter(prefix=prefix).update(last_value=models.F('last_value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefix=prefix, last_value=max_order_number(prefix) + count)
+                except IntegrityError:
+                    # Another worker created it first
+                    cls.objects.filter(prefix=prefix).update(last_value=models.F('last_value') + count)
+            last = cls.objects.filter(prefix=prefix).values_list('last_value', flat=True).get()
+        return [f'{prefix}{n:04d}' for n in range(last - count + 1, last + 1)]
+
+    @classmethod
+    def next(cls, prefix):
+        return cls.reserve(prefix)[0]
+
+def max_order_number(prefix):
+    """Highest numeric suffix already used for `prefix` in Sale/Purchase order ids."""
+    model = Purchase if prefix == 'PO-' else Sale
+    highest = 0
+    for order_id in model.objects.filter(order_id__startswith=prefix).values_list('order_id', flat=True).iterator():
+        try:
+            highest = max(highest, int(order_id[len(prefix):]))
+        except ValueError:
+            pass
+    return highest
+
 class Sale(models.Model):
     order_id = models.CharField(max_length=20, unique=True, editable=False, null=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
@@ -114,25 +281,18 @@ class Sale(models.Model):
     
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # The sales ledger walks (date, id) newest first, optionally within a type or store
+        indexes = [
+            models.Index(fields=['date', 'id']),
+            models.Index(fields=['is_transfer', 'date', 'id']),
+            models.Index(fields=['source_store', 'date', 'id']),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.order_id:
-            prefix = 'TR-' if self.is_transfer else 'SO-'
-            # Find last of this type
-            last_sale = Sale.objects.filter(is_transfer=self.is_transfer).order_by('id').last()
-            
-            if not last_sale:
-                self.order_id = f'{prefix}0001'
-            else:
-                 try:
-                     last_id = last_sale.order_id
-                     if last_id and last_id.startswith(prefix):
-                        num = int(last_id.split('-')[1])
-                        self.order_id = f'{prefix}{num + 1:04d}'
-                     else:
-                        self.order_id = f'{prefix}0001'
-                 except (ValueError, IndexError, AttributeError):
-                     self.order_id = f'{prefix}0001'
+            self.order_id = OrderCounter.next('TR-' if self.is_transfer else 'SO-')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -152,6 +312,62 @@ class SaleItem(models.Model):
         self.subtotal = self.quantity * self.unit_price
         super().save(*args, **kwargs)
 
+class SyncedSale(models.Model):
+    # Idempotency keys of sales uploaded by POS terminals (POST /api/pos/sync/): one row
+    # per client-generated sale id that was applied, so a replayed upload is recognised
+    # instead of selling the same goods twice.
+    key = models.UUIDField(primary_key=True)
+    terminal = models.CharField(max_length=50, blank=True)
+    sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, related_name='+')
+    order_id = models.CharField(max_length=20)  # kept when the sale itself is archived
+    synced_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} -> {self.order_id}"
+
+class DailySalesRollup(models.Model):
+    # Sale totals pre-aggregated per local day, source store, type and sales person.
+    # Checkout adds to the matching row in its own transaction (inventory.reports),
+    # `rebuild_sales_rollups` regenerates any date range from the raw sales.
+    date = models.DateField()
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=True, related_name='sales_rollups')
+    is_transfer = models.BooleanField(default=False)
+    sales_person = models.ForeignKey(SalesPerson, on_delete=models.SET_NULL, null=True, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+    items = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'store', 'is_transfer', 'sales_person'], name='unique_daily_sales_rollup'),
+            # NULLs never collide in a unique index, so the rows without a store or sales
+            # person need their own partial constraints
+            models.UniqueConstraint(fields=['date', 'store', 'is_transfer'], condition=models.Q(sales_person__isnull=True),
+                                    name='unique_daily_sales_rollup_no_person'),
+            models.UniqueConstraint(fields=['date', 'is_transfer', 'sales_person'], condition=models.Q(store__isnull=True),
+                                    name='unique_daily_sales_rollup_no_store'),
+            models.UniqueConstraint(fields=['date', 'is_transfer'], condition=models.Q(store__isnull=True, sales_person__isnull=True),
+                                    name='unique_daily_sales_rollup_no_store_person'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.store} {'transfers' if self.is_transfer else 'sales'}: {self.revenue}"
+
+@receiver(pre_delete, sender=SalesPerson)
+def merge_sales_person_rollups(sender, instance, **kwargs):
+    # SET_NULL would turn the person's rows into second "no sales person" rows wherever
+    # one already exists for that day, store and type (unique_daily_sales_rollup_no_person),
+    # so add those into the existing row first; the rest are simply set to NULL
+    for row in DailySalesRollup.objects.filter(sales_person=instance):
+        merged = DailySalesRollup.objects.filter(
+            date=row.date, store_id=row.store_id, is_transfer=row.is_transfer, sales_person__isnull=True,
+        ).update(
+            revenue=models.F('revenue') + row.revenue, orders=models.F('orders') + row.orders,
+            items=models.F('items') + row.items,
+        )
+        if merged:
+            row.delete()
+
 class Purchase(models.Model):
     order_id = models.CharField(max_length=20, unique=True, editable=False, null=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
@@ -166,19 +382,7 @@ class Purchase(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.order_id:
-            last_purchase = Purchase.objects.all().order_by('id').last()
-            if not last_purchase:
-                self.order_id = 'PO-0001'
-            else:
-                 try:
-                     last_id = last_purchase.order_id
-                     if last_id and last_id.startswith('PO-'):
-                        num = int(last_id.split('-')[1])
-                        self.order_id = f'PO-{num + 1:04d}'
-                     else:
-                        self.order_id = 'PO-0001'
-                 except (ValueError, IndexError, AttributeError):
-                     self.order_id = 'PO-0001'
+            self.order_id = OrderCounter.next('PO-')
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -194,3 +398,93 @@ class PurchaseItem(models.Model):
     def save(self, *args, **kwargs):
         self.subtotal = self.quantity * self.unit_cost
         super().save(*args, **kwargs)
+
+class ImportJob(models.Model):
+    # Uploaded import file processed outside the web request by `manage.py run_import_worker`
+    KIND_CHOICES = [
+        ('products', 'Products'),
+        ('customers', 'Customers'),
+        ('salespeople', 'Sales People'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    file = models.FileField(upload_to='imports/')
+    original_name = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    store = models.ForeignKey(Store, on_delete=models.SET_NULL, null=True, blank=True, help_text="Receiving store for product quantities")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    rows_processed = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import #{self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('DONE', 'FAILED')
+
+class ArchiveSegment(models.Model):
+    # Manifest of history moved out of the live tables by `archive_history`: one gzip'd
+    # CSV per kind and month (a later pass over the same month adds another part) under
+    # settings.ARCHIVE_ROOT. inventory.archive reads them back for queries.
+    KIND_CHOICES = [
+        ('stocklog', 'Stock Log'),
+        ('sale', 'Sale'),
+        ('saleitem', 'Sale Item'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    month = models.DateField(help_text="First day of the archived month (local time)")
+    path = models.CharField(max_length=255, help_text="Relative to ARCHIVE_ROOT")
+    rows = models.PositiveIntegerField(default=0)
+    first_id = models.PositiveBigIntegerField(null=True)
+    last_id = models.PositiveBigIntegerField(null=True)
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['kind', 'month'])]
+
+    def __str__(self):
+        return f"{self.kind} {self.month:%Y-%m} ({self.rows} rows)"
+
+class RequestProfile(models.Model):
+    # cProfile capture of one request's view and template rendering, taken by
+    # inventory.middleware.ProfilerMiddleware. Download from the admin and open with
+    # `python -m pstats` or snakeviz.
+    REASON_CHOICES = [
+        ('requested', 'Requested'),
+        ('sampled', 'Sampled'),
+    ]
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    query_string = models.TextField(blank=True)
+    url_name = models.CharField(max_length=100, blank=True)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    queries = models.PositiveIntegerField(null=True, blank=True)
+    summary = models.TextField(blank=True, help_text="Top functions by cumulative time")
+    stats = models.BinaryField(help_text="pstats dump (marshal), as written by Stats.dump_stats")
+
+    class Meta:
+        indexes = [models.Index(fields=['created_at'])]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
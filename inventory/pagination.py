@@ -0,0 +1,108 @@
+import base64
+import json
+
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+# Keyset ("seek") pagination: each page is `WHERE key > cursor ORDER BY key LIMIT n+1`,
+# so deep pages cost the same as the first one. `fields` is an ordering on a unique,
+# indexed key such as ('updated_at', 'id'); prefix a field with '-' to walk it
+# descending. Cursors are base64 JSON of the last row's key; datetimes travel as ISO strings.
+
+def encode_cursor(obj, fields):
+    values = []
+    for f in fields:
+        value = getattr(obj, f.lstrip('-'))
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, fields, model):
+    """Raises ValueError for anything that isn't a cursor made by encode_cursor for
+    `fields` of `model`: each value must match its field (an ISO datetime string for a
+    DateTimeField, an integer for an integer field), so nothing else reaches the ORM."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError("Invalid cursor.")
+    parsed = []
+    for field, value in zip(fields, values):
+        model_field = model._meta.get_field(field.lstrip('-'))
+        if isinstance(model_field, models.DateTimeField) and isinstance(value, str):
+            value = parse_datetime(value)
+        elif not (isinstance(model_field, models.IntegerField) and isinstance(value, int) and not isinstance(value, bool)):
+            value = None
+        if value is None:
+            raise ValueError("Invalid cursor.")
+        parsed.append(value)
+    return parsed
+
+
+def keyset_after(fields, values):
+    # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y); '<' for descending fields
+    condition = Q()
+    for i, field in enumerate(fields):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for prev, prev_value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, fields, cursor=None, size=100):
+    """One page of `queryset` in `fields` order, starting after `cursor`.
+    Returns (rows, next_cursor); next_cursor is None on the last page."""
+    queryset = queryset.order_by(*fields)
+    if cursor:
+        queryset = queryset.filter(keyset_after(fields, decode_cursor(cursor, fields, queryset.model)))
+    rows = list(queryset[:size + 1])
+    next_cursor = encode_cursor(rows[size - 1], fields) if len(rows) > size else None
+    return rows[:size], next_cursor
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination using keyset_page. The view sets `keyset_fields` (default ('id',))."""
+    page_size = 100
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_fields(self, view):
+        return tuple(getattr(view, 'keyset_fields', ('id',)))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Must be an integer."})
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            rows, self.next_cursor = keyset_page(
+                queryset, self.get_fields(view),
+                request.query_params.get(self.cursor_query_param), self.get_page_size(request),
+            )
+        except ValueError as e:
+            raise ValidationError({self.cursor_query_param: str(e)})
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        params = self.request.query_params.copy()
+        params[self.cursor_query_param] = self.next_cursor
+        return self.request.build_absolute_uri(self.request.path) + '?' + params.urlencode()
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
@@ -0,0 +1,100 @@
+from collections import defaultdict
+
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archive import archived_until
+from .models import Sale, SaleItem, DailySalesRollup
+
+
+# Reports read DailySalesRollup (one row per day/store/type/sales person) instead of
+# aggregating the whole Sale table, so their cost follows the number of days shown,
+# not the number of sales. Days are local dates, the same as TruncDate('date').
+
+def rollup_key(sale):
+    return {
+        'date': timezone.localdate(sale.date),
+        'store_id': sale.source_store_id,
+        'is_transfer': sale.is_transfer,
+        'sales_person_id': sale.sales_person_id,
+    }
+
+
+def add_sale_to_rollup(sale, items):
+    """Add one sale (`items` = total quantity sold) to its rollup row. Call it inside the
+    transaction that created the sale so both commit or roll back together."""
+    key = rollup_key(sale)
+    increment = {'revenue': F('revenue') + sale.total_amount, 'orders': F('orders') + 1, 'items': F('items') + items}
+    if DailySalesRollup.objects.filter(**key).update(**increment):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(**key, revenue=sale.total_amount, orders=1, items=items)
+    except IntegrityError:
+        # Another checkout created the row first
+        DailySalesRollup.objects.filter(**key).update(**increment)
+
+
+def _date_range(queryset, field, start, end):
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lte': end})
+    return queryset
+
+
+def rebuild_rollups(start=None, end=None):
+    """Regenerate the rollups for local dates start..end (inclusive, open-ended when None)
+    from Sale/SaleItem. Returns the number of rollup rows written.
+
+    Archived months are skipped: their sales are no longer in the tables, and their
+    rollups were complete when they were archived."""
+    boundary = archived_until('sale')
+    if boundary and (start is None or start < boundary):
+        start = boundary
+    if start and end and start > end:
+        return 0
+    group = ('day', 'source_store', 'is_transfer', 'sales_person')
+    sales = _date_range(Sale.objects.all(), 'date__date', start, end)
+    totals = sales.annotate(day=TruncDate('date')).values(*group).annotate(
+        revenue=Sum('total_amount'), orders=Count('id')
+    ).order_by()
+
+    items = _date_range(SaleItem.objects.all(), 'sale__date__date', start, end)
+    quantities = defaultdict(int)
+    for row in items.annotate(day=TruncDate('sale__date')).values(
+        'day', 'sale__source_store', 'sale__is_transfer', 'sale__sales_person'
+    ).annotate(quantity=Sum('quantity')).order_by():
+        quantities[(row['day'], row['sale__source_store'], row['sale__is_transfer'], row['sale__sales_person'])] = row['quantity']
+
+    rows = [
+        DailySalesRollup(
+            date=row['day'], store_id=row['source_store'], is_transfer=row['is_transfer'],
+            sales_person_id=row['sales_person'], revenue=row['revenue'], orders=row['orders'],
+            items=quantities[tuple(row[f] for f in group)],
+        ) for row in totals
+    ]
+    with transaction.atomic():
+        _date_range(DailySalesRollup.objects.all(), 'date', start, end).delete()
+        DailySalesRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def sales_rollups(start=None, end=None, store_id=None, is_transfer=False):
+    rollups = _date_range(DailySalesRollup.objects.filter(is_transfer=is_transfer), 'date', start, end)
+    if store_id:
+        rollups = rollups.filter(store_id=store_id)
+    return rollups
+
+
+def daily_sales(**filters):
+    """Revenue, order and item counts per day, newest first."""
+    return sales_rollups(**filters).values('date').annotate(
+        total=Sum('revenue'), count=Sum('orders'), items=Sum('items')
+    ).order_by('-date')
+
+
+def total_revenue(**filters):
+    return sales_rollups(**filters).aggregate(total=Sum('revenue'))['total'] or 0
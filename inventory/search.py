@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+# Product search backends, picked by database vendor:
+#   SQLite     -> FTS5 table `inventory_product_fts` (trigram tokenizer, so substrings match
+#                 like icontains did) kept in sync by triggers, see migration 0011.
+#   PostgreSQL -> pg_trgm GIN indexes on UPPER(name)/UPPER(code), which serve icontains,
+#                 ranked by trigram similarity.
+#   Others     -> plain icontains.
+# Triggers/indexes cover every write path (save, update(), bulk_create), so imports
+# need no extra work to stay searchable.
+
+FTS_TABLE = 'inventory_product_fts'
+MIN_TERM = 3  # trigram queries need at least 3 characters
+
+_fts_ready = None
+
+
+def _sqlite_fts_ready():
+    global _fts_ready
+    if _fts_ready is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts_ready = cursor.fetchone() is not None
+    return _fts_ready
+
+
+# Rebuilding a table on SQLite (some ALTERs in later migrations) drops its triggers, so
+# they are checked after every migrate and restored with a full index rebuild if missing.
+SQLITE_TRIGGERS = {
+    'inventory_product_fts_ai': """CREATE TRIGGER inventory_product_fts_ai AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(rowid, name, code) VALUES (new.id, new.name, new.code);
+    END""",
+    'inventory_product_fts_ad': """CREATE TRIGGER inventory_product_fts_ad AFTER DELETE ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, name, code) VALUES ('delete', old.id, old.name, old.code);
+    END""",
+    'inventory_product_fts_au': """CREATE TRIGGER inventory_product_fts_au AFTER UPDATE OF name, code ON inventory_product BEGIN
+        INSERT INTO inventory_product_fts(inventory_product_fts, rowid, name, code) VALUES ('delete', old.id, old.name, old.code);
+        INSERT INTO inventory_product_fts(rowid, name, code) VALUES (new.id, new.name, new.code);
+    END""",
+}
+
+
+def repair_search_triggers(using='default', **kwargs):
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'inventory_product'")
+        present = {row[0] for row in cursor.fetchall()}
+        missing = [sql for name, sql in SQLITE_TRIGGERS.items() if name not in present]
+        if missing:
+            for sql in missing:
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def _fts_query(q):
+    terms = [t for t in q.split() if len(t) >= MIN_TERM]
+    return ' '.join('"%s"' % t.replace('"', '""') for t in terms)
+
+
+def _prefix_filter(q):
+    return Q(code__istartswith=q) | Q(name__istartswith=q)
+
+
+def search_products(q, limit=None):
+    """Products matching `q`, best first. Returns a list when ranked by the index,
+    otherwise a queryset."""
+    q = (q or '').strip()
+    limit = limit or None
+    products = Product.objects.select_related('category')
+    if not q:
+        return products.none()
+
+    if connection.vendor == 'sqlite' and _sqlite_fts_ready():
+        match = _fts_query(q)
+        if not match:
+            # Too short for the trigram index: prefix match on the indexed columns instead
+            found = products.filter(_prefix_filter(q)).order_by('code')
+            return found[:limit] if limit else found
+        short_terms = [t for t in q.split() if len(t) < MIN_TERM]
+        if short_terms:
+            # e.g. "bulk 2": the index narrows on "bulk", the short terms filter what it found
+            found = products.filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]))
+            for t in short_terms:
+                found = found.filter(Q(name__icontains=t) | Q(code__icontains=t))
+            found = found.order_by('code')
+            return found[:limit] if limit else found
+        sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank"
+        params = [match]
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+        by_id = products.in_bulk(ids)
+        return [by_id[i] for i in ids if i in by_id]
+
+    found = products.filter(Q(name__icontains=q) | Q(code__icontains=q))
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        from django.db.models.functions import Greatest
+        found = found.annotate(
+            rank=Greatest(TrigramSimilarity('name', q), TrigramSimilarity('code', q))
+        ).order_by('-rank', 'code')
+    else:
+        found = found.order_by('code')
+    return found[:limit] if limit else found
+
+
+def search_limit(value):
+    try:
+        return max(1, min(int(value), settings.SEARCH_MAX_RESULTS))
+    except (TypeError, ValueError):
+        return settings.SEARCH_RESULTS
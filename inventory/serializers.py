@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Product, Category, StockLog
+from .models import Product, Category, Store, StockLog, Purchase, PurchaseItem
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,8 +12,96 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+        # Maintained from Stock movements, never written through the API
+        read_only_fields = ('quantity',)
+
+    def update(self, instance, validated_data):
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        # Never write back the loaded quantity, a sale may have moved it since
+        instance.save(update_fields=[f.name for f in Product._meta.concrete_fields if not f.primary_key and f.name != 'quantity'])
+        return instance
 
 class StockLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = StockLog
         fields = '__all__'
+
+class PurchaseItemSerializer(serializers.ModelSerializer):
+    code = serializers.ReadOnlyField(source='product.code')
+
+    class Meta:
+        model = PurchaseItem
+        fields = ('product', 'code', 'quantity', 'unit_cost', 'subtotal')
+
+class PurchaseSerializer(serializers.ModelSerializer):
+    items = PurchaseItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Purchase
+        fields = ('id', 'order_id', 'user', 'supplier', 'destination_store', 'total_amount', 'date', 'note', 'items')
+
+class PurchaseLineSerializer(serializers.Serializer):
+    # A line names its product by id or by code
+    product = serializers.IntegerField(required=False)
+    code = serializers.CharField(required=False)
+    quantity = serializers.IntegerField(min_value=1)
+    unit_cost = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, allow_null=True)
+
+    def validate(self, data):
+        if ('product' in data) == ('code' in data):
+            raise serializers.ValidationError("Give either product or code.")
+        return data
+
+class PurchaseOrderSerializer(serializers.Serializer):
+    store = serializers.PrimaryKeyRelatedField(queryset=Store.objects.all())
+    supplier = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    note = serializers.CharField(required=False, allow_blank=True)
+    items = PurchaseLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        # Resolve codes to ids with one query
+        codes = {line['code'] for line in items if 'code' in line}
+        ids = dict(Product.objects.filter(code__in=codes).values_list('code', 'id'))
+        unknown = sorted(codes - set(ids))
+        if unknown:
+            raise serializers.ValidationError(f"Unknown product codes: {', '.join(unknown)}")
+        for line in items:
+            if 'code' in line:
+                line['product'] = ids[line['code']]
+        return items
+
+class StockMovementSerializer(serializers.Serializer):
+    # Products and stores are looked up for the whole batch at once by the view
+    code = serializers.CharField()
+    store = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=StockLog.ACTION_CHOICES)
+    quantity = serializers.IntegerField()
+    reference = serializers.CharField(max_length=200, required=False, allow_blank=True)
+
+    def validate(self, data):
+        if data['quantity'] == 0:
+            raise serializers.ValidationError({'quantity': "Must not be 0."})
+        if data['action'] != 'ADJUST' and data['quantity'] < 0:
+            raise serializers.ValidationError({'quantity': "Must be positive; only ADJUST takes a sign."})
+        return data
+
+class SyncLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(required=False)
+    code = serializers.CharField(required=False)
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, allow_null=True)
+
+    def validate(self, data):
+        if ('product' in data) == ('code' in data):
+            raise serializers.ValidationError("Give either product or code.")
+        return data
+
+class SyncSaleSerializer(serializers.Serializer):
+    # One sale queued by a POS terminal; `id` is the terminal's UUID for it
+    id = serializers.UUIDField()
+    created_at = serializers.DateTimeField(required=False)
+    store = serializers.IntegerField()
+    customer = serializers.IntegerField(required=False, allow_null=True)
+    sales_person = serializers.IntegerField(required=False, allow_null=True)
+    lines = SyncLineSerializer(many=True, allow_empty=False)
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q, Max, Min
+from django.utils import timezone
+
+from .archive import archived, archived_until
+from .models import Product, Store, Stock, StockLog, StockSnapshot
+
+
+# Point-in-time stock. Checkpoints are StockSnapshot rows (nightly) and the live Stock
+# table itself (a checkpoint at "now"). Stock at moment D is the checkpoint nearest to D
+# plus the StockLog changes after it (checkpoint before D) or minus the changes after D
+# (checkpoint after D), so only the logs between the two are read, never all history.
+
+SNAPSHOT_BATCH = 5000
+
+
+def take_snapshot(as_of=None):
+    """Copy every non-zero Stock row into StockSnapshot at `as_of` (default now).
+    Returns the number of rows written."""
+    as_of = as_of or timezone.now()
+    written = 0
+    with transaction.atomic():
+        batch = []
+        for store_id, product_id, quantity in Stock.objects.exclude(quantity=0).values_list(
+            'store_id', 'product_id', 'quantity'
+        ).iterator(chunk_size=SNAPSHOT_BATCH):
+            batch.append(StockSnapshot(store_id=store_id, product_id=product_id, quantity=quantity, as_of=as_of))
+            if len(batch) >= SNAPSHOT_BATCH:
+                StockSnapshot.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        StockSnapshot.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def prune_snapshots(daily_days):
+    """Keep every snapshot from the last `daily_days` days and only the first snapshot
+    of each month before that. Returns the number of rows deleted."""
+    cutoff = timezone.now() - timedelta(days=daily_days)
+    deleted = 0
+    for store_id in Store.objects.values_list('id', flat=True):
+        old = StockSnapshot.objects.filter(store_id=store_id, as_of__lt=cutoff)
+        keep = {}
+        for as_of in old.values_list('as_of', flat=True).distinct().order_by('as_of'):
+            keep.setdefault(timezone.localdate(as_of).replace(day=1), as_of)
+        count, _ = old.exclude(as_of__in=list(keep.values())).delete()
+        deleted += count
+    return deleted
+
+
+def nearest_checkpoint(store_id, when):
+    """(as_of, direction): the snapshot time (None for live Stock) to start from, and
+    +1 to replay logs forward from it or -1 to unwind them backward."""
+    found = StockSnapshot.objects.filter(store_id=store_id).aggregate(
+        before=Max('as_of', filter=Q(as_of__lte=when)),
+        after=Min('as_of', filter=Q(as_of__gt=when)),
+    )
+    before, after = found['before'], found['after']
+    after_distance = (after or timezone.now()) - when
+    if before is not None and when - before <= after_distance:
+        return before, 1
+    return after, -1
+
+
+def stock_as_of(store_id, when):
+    """Stock in a store at `when`, as (checkpoint, rows). rows are dicts (product_id, code,
+    name, quantity) with a non-zero quantity, ordered by code; checkpoint is the snapshot
+    time used, or None for live stock. After picking the checkpoint, the stock comes
+    from a single query bounded by the checkpoint's rows and the logs between it and
+    `when`."""
+    checkpoint, direction = nearest_checkpoint(store_id, when)
+    if checkpoint is not None:
+        base = StockSnapshot.objects.filter(store_id=store_id, as_of=checkpoint)
+    else:
+        base = Stock.objects.filter(store_id=store_id).exclude(quantity=0)
+    base = base.values(pid=F('product_id'), qty=F('quantity'))
+
+    logs = StockLog.objects.filter(store_id=store_id)
+    if direction > 0:
+        window = (checkpoint, when)
+        logs = logs.filter(timestamp__gt=checkpoint, timestamp__lte=when).values(
+            pid=F('product_id'), qty=F('quantity_change'))
+    else:
+        window = (when, checkpoint)
+        logs = logs.filter(timestamp__gt=when)
+        if checkpoint is not None:
+            logs = logs.filter(timestamp__lte=checkpoint)
+        logs = logs.values(pid=F('product_id'), qty=-F('quantity_change'))
+
+    sql, params = base.union(logs, all=True).query.sql_with_params()
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT p.id, p.code, p.name, SUM(t.qty) FROM ({sql}) t "
+            f"INNER JOIN {product_table} p ON p.id = t.pid "
+            f"GROUP BY p.id, p.code, p.name", params,
+        )
+        totals = {row[0]: list(row) for row in cursor.fetchall()}
+
+    # Logs between the checkpoint and `when` that were already moved to the archive
+    boundary = archived_until('stocklog')
+    if boundary and timezone.localdate(window[0]) < boundary:
+        lo, hi = window
+
+        def in_window(log):
+            # Same bounds as the SQL above: lo < timestamp <= hi
+            return log.store_id == store_id and log.timestamp > lo and (hi is None or log.timestamp <= hi)
+
+        extra = defaultdict(int)
+        end = hi + timedelta(microseconds=1) if hi else None
+        for log in archived('stocklog', start=lo, end=end, match=in_window):
+            extra[log.product_id] += direction * log.quantity_change
+        missing = set(extra) - set(totals)
+        for p in Product.objects.filter(id__in=missing).values_list('id', 'code', 'name'):
+            totals[p[0]] = list(p) + [0]
+        for product_id, delta in extra.items():
+            if product_id in totals:
+                totals[product_id][3] += delta
+
+    rows = [
+        {'product_id': pid, 'code': code, 'name': name, 'quantity': qty}
+        for pid, code, name, qty in totals.values() if qty
+    ]
+    rows.sort(key=lambda r: r['code'])
+    return checkpoint, rows
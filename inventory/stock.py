@@ -0,0 +1,330 @@
+from collections import defaultdict
+
+from django.db.models import F, Q, Sum, Count, OuterRef, Subquery, Case, When, Value, IntegerField, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, Stock, Store, StoreValuation, Sale, SaleItem, Purchase, PurchaseItem, StockLog
+from .cache import bump
+from .reports import add_sale_to_rollup
+
+
+# Product.quantity is the maintained global total (sum of Stock.quantity over all stores).
+# Every stock-changing path goes through these helpers so both tables move together.
+# Callers are expected to be inside transaction.atomic().
+
+def lock_stocks(pairs):
+    """Make sure a Stock row exists for every (store_id, product_id) pair and return
+    them all locked (SELECT ... FOR UPDATE, in id order), keyed by pair."""
+    pairs = set(pairs)
+    Stock.objects.bulk_create(
+        [Stock(store_id=store_id, product_id=product_id) for store_id, product_id in pairs],
+        ignore_conflicts=True,
+    )
+    by_store = defaultdict(list)
+    for store_id, product_id in pairs:
+        by_store[store_id].append(product_id)
+    match = Q()
+    for store_id, product_ids in by_store.items():
+        match |= Q(store_id=store_id, product_id__in=product_ids)
+    rows = Stock.objects.select_for_update().filter(match).order_by('id')
+    return {(row.store_id, row.product_id): row for row in rows}
+
+
+def _delta_case(deltas):
+    return Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+def apply_stock_changes(changes, locked=None, prices=None):
+    """Apply {(store_id, product_id): delta} to Stock, Product.quantity and the stores'
+    valuations with one UPDATE per table, whatever the number of lines. `prices`
+    ({product_id: purchase_price}) saves looking the costs up when the caller has them."""
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    if locked is None:
+        locked = lock_stocks(changes)
+    if prices is None:
+        prices = dict(Product.objects.filter(id__in={p_id for _, p_id in changes}).values_list('id', 'purchase_price'))
+
+    stock_deltas = {locked[key].id: delta for key, delta in changes.items()}
+    Stock.objects.filter(id__in=stock_deltas).update(quantity=F('quantity') + _delta_case(stock_deltas))
+
+    product_deltas = defaultdict(int)
+    for (store_id, product_id), delta in changes.items():
+        product_deltas[product_id] += delta
+    product_deltas = {pk: delta for pk, delta in product_deltas.items() if delta}
+    if product_deltas:
+        # updated_at moves too, so API pollers (updated_since / ETag) see stock changes.
+        # A bound timezone.now() rather than Now(): SQLite's Now() stores fewer digits than
+        # Django does, and the (updated_at, id) keyset cursor would skip the mismatched rows.
+        Product.objects.filter(id__in=product_deltas).update(
+            quantity=F('quantity') + _delta_case(product_deltas), updated_at=timezone.now()
+        )
+
+    values = defaultdict(int)
+    for (store_id, product_id), delta in changes.items():
+        values[store_id] += delta * prices[product_id]
+    StoreValuation.add(values)
+    bump(*{f'stock:{store_id}' for store_id, _ in changes})
+
+
+def recompute_totals(product_ids=None):
+    """Rewrite Product.quantity from Stock in one UPDATE. Returns the number of products touched."""
+    totals = Stock.objects.filter(product=OuterRef('pk')).values('product').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    return products.update(quantity=Coalesce(Subquery(totals), 0))
+
+
+def computed_valuations():
+    """{store_id: value} recomputed from Stock (the slow join StoreValuation replaces)."""
+    rows = Stock.objects.values('store_id').annotate(
+        value=Sum(F('quantity') * F('product__purchase_price'), output_field=DecimalField(max_digits=16, decimal_places=2))
+    ).order_by()
+    return {row['store_id']: row['value'] or 0 for row in rows}
+
+
+def mismatched_valuations():
+    """[(store, stored, computed)] for stores whose stored valuation is wrong."""
+    computed = computed_valuations()
+    stored = dict(StoreValuation.objects.values_list('store_id', 'value'))
+    return [
+        (store, stored.get(store.id, 0), computed.get(store.id, 0))
+        for store in Store.objects.order_by('name')
+        if stored.get(store.id, 0) != computed.get(store.id, 0)
+    ]
+
+
+def rebuild_valuations():
+    """Rewrite every store's valuation from Stock. Returns the number of stores."""
+    computed = computed_valuations()
+    store_ids = list(Store.objects.values_list('id', flat=True))
+    StoreValuation.objects.exclude(store_id__in=store_ids).delete()
+    StoreValuation.objects.bulk_create(
+        [StoreValuation(store_id=store_id, value=computed.get(store_id, 0)) for store_id in store_ids],
+        update_conflicts=True, unique_fields=['store'], update_fields=['value', 'updated_at'],
+    )
+    return len(store_ids)
+
+
+def mismatched_totals():
+    """Products whose stored total disagrees with the sum of their Stock rows."""
+    return Product.objects.annotate(
+        stock_sum=Coalesce(Sum('stocks__quantity'), 0)
+    ).exclude(quantity=F('stock_sum'))
+
+
+# Low stock: a product is low when its global total is at or below min_stock_alert.
+# Per store, a Stock row is low when it is at or below the product's alert level.
+
+def low_stock_products():
+    return Product.objects.filter(quantity__lte=F('min_stock_alert'))
+
+
+def most_critical(limit=5, store_id=None):
+    """Top `limit` shortfalls as dicts (name, code, quantity), worst first."""
+    if store_id:
+        rows = Stock.objects.filter(
+            store_id=store_id, quantity__lte=F('product__min_stock_alert')
+        ).annotate(
+            name=F('product__name'), code=F('product__code'),
+            shortfall=F('product__min_stock_alert') - F('quantity'),
+        )
+    else:
+        rows = low_stock_products().annotate(shortfall=F('min_stock_alert') - F('quantity'))
+    return rows.order_by('-shortfall', 'quantity').values('name', 'code', 'quantity')[:limit]
+
+
+def low_stock_by_store():
+    return Store.objects.annotate(
+        low_stock_count=Count('stocks', filter=Q(stocks__quantity__lte=F('stocks__product__min_stock_alert'))),
+        stock_value=F('valuation__value'),
+    ).order_by('name')
+
+
+def record_sale(user, lines, source_store, dest_store=None, customer=None, sales_person=None, date=None):
+    """Create a Sale (or a transfer when dest_store is given) for `lines`, a list of
+    (product_id, quantity, unit_price), moving stock in a constant number of queries.
+    A unit_price of None means the product's current selling price. `date` backdates
+    the sale (and its rollup) for sales made offline; the stock moves now either way.
+
+    Raises Exception with the same messages the POS has always shown."""
+    is_transfer = dest_store is not None
+    products = Product.objects.in_bulk([p_id for p_id, _, _ in lines])
+
+    pairs = [(source_store.id, int(p_id)) for p_id, _, _ in lines]
+    if is_transfer:
+        pairs += [(dest_store.id, int(p_id)) for p_id, _, _ in lines]
+    locked = lock_stocks(pairs)
+
+    changes = defaultdict(int)
+    resolved = []
+    for p_id, qty, price in lines:
+        product = products.get(int(p_id))
+        if product is None:
+            raise Product.DoesNotExist("Product matching query does not exist.")
+        resolved.append((product.id, qty, product.selling_price if price is None else price))
+        src_stock = locked[(source_store.id, product.id)]
+        changes[(source_store.id, product.id)] -= qty
+        if src_stock.quantity < -changes[(source_store.id, product.id)]:
+            raise Exception(f"Not enough stock for {product.name} in {source_store.name}. Available: {src_stock.quantity}")
+        if is_transfer:
+            changes[(dest_store.id, product.id)] += qty
+    apply_stock_changes(changes, locked, prices={p.id: p.purchase_price for p in products.values()})
+
+    # Internal transfer cost is 0
+    total_amt = 0 if is_transfer else sum(qty * price for _, qty, price in resolved)
+    sale = Sale.objects.create(
+        user=user,
+        total_amount=total_amt,
+        customer=customer,
+        sales_person=sales_person,
+        source_store=source_store,
+        destination_store=dest_store,
+        is_transfer=is_transfer
+    )
+    if date is not None:
+        # date is auto_now_add, so it can only be changed after the insert
+        Sale.objects.filter(pk=sale.pk).update(date=date)
+        sale.date = date
+
+    items = []
+    logs = []
+    for p_id, qty, price in resolved:
+        price = 0 if is_transfer else price
+        # bulk_create skips SaleItem.save(), so fill subtotal here
+        items.append(SaleItem(sale=sale, product_id=p_id, quantity=qty, unit_price=price, subtotal=qty * price))
+        logs.append(StockLog(
+            product_id=p_id,
+            store=source_store,
+            user=user,
+            action='TRANSFER_OUT' if is_transfer else 'SALE',
+            quantity_change=-qty,
+            reason=f"{'Transfer' if is_transfer else 'Sale'} {sale.order_id}"
+        ))
+        if is_transfer:
+            logs.append(StockLog(
+                product_id=p_id,
+                store=dest_store,
+                user=user,
+                action='TRANSFER_IN',
+                quantity_change=qty,
+                reason=f"Transfer {sale.order_id}"
+            ))
+    SaleItem.objects.bulk_create(items)
+    StockLog.objects.bulk_create(logs)
+    add_sale_to_rollup(sale, sum(qty for _, qty, _ in resolved))
+    return sale
+
+
+def record_purchase(user, store, lines, supplier=None, note=''):
+    """Receive a delivery into `store` as one Purchase. `lines` is a list of
+    (product_id, quantity, unit_cost); a unit_cost of None keeps the product's current
+    purchase price. As a single-line purchase always did, each product's purchase price
+    becomes the cost it was received at (the last line's, if it appears twice).
+    Runs a constant number of queries whatever the number of lines.
+
+    Raises ValueError (or Product.DoesNotExist) with a message for the user."""
+    if not lines:
+        raise ValueError("A purchase needs at least one line.")
+    products = Product.objects.in_bulk({int(p_id) for p_id, _, _ in lines})
+
+    changes = defaultdict(int)
+    new_prices = {}
+    resolved = []
+    for number, (p_id, qty, cost) in enumerate(lines, start=1):
+        product = products.get(int(p_id))
+        if product is None:
+            raise Product.DoesNotExist(f"Line {number}: product {p_id} does not exist.")
+        if qty <= 0:
+            raise ValueError(f"Line {number}: quantity must be positive.")
+        if cost is None:
+            cost = product.purchase_price
+        elif cost < 0:
+            raise ValueError(f"Line {number}: cost cannot be negative.")
+        changes[(store.id, product.id)] += qty
+        new_prices[product.id] = cost
+        resolved.append((product.id, qty, cost))
+
+    # Stock arrives at the old cost, then the repricing below revalues all of it
+    old_prices = {p.id: p.purchase_price for p in products.values()}
+    apply_stock_changes(changes, prices=old_prices)
+    price_changes = {pk: price - old_prices[pk] for pk, price in new_prices.items() if price != old_prices[pk]}
+    if price_changes:
+        Product.objects.filter(id__in=price_changes).update(
+            purchase_price=Case(
+                *[When(pk=pk, then=Value(new_prices[pk])) for pk in price_changes],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+            updated_at=timezone.now(),  # not Now(), see apply_stock_changes
+        )
+        StoreValuation.revalue_products(price_changes)
+        bump('catalog')  # update() sends no post_save
+
+    purchase = Purchase.objects.create(
+        user=user,
+        supplier=supplier or None,
+        destination_store=store,
+        total_amount=sum(qty * cost for _, qty, cost in resolved),
+        note=note,
+    )
+    # bulk_create skips PurchaseItem.save(), so fill subtotal here
+    PurchaseItem.objects.bulk_create([
+        PurchaseItem(purchase=purchase, product_id=p_id, quantity=qty, unit_cost=cost, subtotal=qty * cost)
+        for p_id, qty, cost in resolved
+    ])
+    StockLog.objects.bulk_create([
+        StockLog(
+            product_id=p_id, store=store, user=user, action='PURCHASE',
+            quantity_change=qty, reason=f"Purchase {purchase.order_id}",
+        ) for p_id, qty, _ in resolved
+    ])
+    return purchase
+
+
+# Stock movements pushed by external systems (POST /api/stock-movements/). The action
+# decides the sign of the quantity; ADJUST takes it as given.
+MOVEMENT_SIGNS = {
+    'ADD': 1, 'PURCHASE': 1, 'TRANSFER_IN': 1,
+    'REMOVE': -1, 'SALE': -1, 'TRANSFER_OUT': -1,
+    'ADJUST': None,
+}
+
+
+def record_movements(user, movements):
+    """Apply `movements`, a list of (store_id, product_id, action, delta, reason), in order
+    and all together: one lock query, one UPDATE per table and one StockLog insert.
+
+    Returns (errors, stock_after): errors maps the index of every movement that would take
+    a store's stock below zero to a message, and stock_after the index of every other
+    movement to the stock it leaves. Nothing is written when there are errors, but the
+    caller must roll back (the Stock rows locked here may have been created)."""
+    locked = lock_stocks({(store_id, product_id) for store_id, product_id, _, _, _ in movements})
+    balance = {key: row.quantity for key, row in locked.items()}
+    changes = defaultdict(int)
+    errors = {}
+    stock_after = {}
+    for index, (store_id, product_id, action, delta, reason) in enumerate(movements):
+        key = (store_id, product_id)
+        if balance[key] + delta < 0:
+            errors[index] = f"Not enough stock: {balance[key]} available."
+            continue
+        balance[key] += delta
+        changes[key] += delta
+        stock_after[index] = balance[key]
+    if errors:
+        return errors, stock_after
+
+    apply_stock_changes(changes, locked)
+    StockLog.objects.bulk_create([
+        StockLog(product_id=product_id, store_id=store_id, user=user, action=action, quantity_change=delta, reason=reason)
+        for store_id, product_id, action, delta, reason in movements
+    ])
+    return errors, stock_after
@@ -1,3 +1,372 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import Category, Customer, DailySalesRollup, ImportJob, OrderCounter, Product, Sale, SalesPerson, Stock, StockLog, Store, StoreValuation
+from .archive import archive_month
+from .jobs import run_job
+from .stock import (
+    apply_stock_changes, computed_valuations, mismatched_totals, mismatched_valuations, record_purchase, record_sale,
+)
+from .views import ProductViewSet
+
+
+# Cached reads must not leak between tests (or from a dev server's file cache)
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InventoryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+class StockTestCase(InventoryTestCase):
+    # Two stores and three products; Main holds 10 of each
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clerk', password='pw')
+        cls.main = Store.objects.create(name='Main')
+        cls.branch = Store.objects.create(name='Branch')
+        cls.products = [
+            Product.objects.create(code=f'P{i}', name=f'Widget {i}', purchase_price=Decimal('1.50') * (i + 1), selling_price=10)
+            for i in range(3)
+        ]
+        with transaction.atomic():
+            apply_stock_changes({(cls.main.id, p.id): 10 for p in cls.products})
+
+    def stock(self, store, product):
+        return Stock.objects.filter(store=store, product=product).values_list('quantity', flat=True).first() or 0
+
+    def assertConsistent(self):
+        self.assertEqual(list(mismatched_totals()), [])
+        self.assertEqual(mismatched_valuations(), [])
+
+
+class ApplyStockChangesTests(StockTestCase):
+    def test_totals_and_valuations_follow_the_changes(self):
+        a, b, c = self.products
+        with transaction.atomic():
+            apply_stock_changes({(self.main.id, a.id): -4, (self.branch.id, a.id): 4, (self.branch.id, b.id): 7, (self.main.id, c.id): 0})
+        self.assertEqual((self.stock(self.main, a), self.stock(self.branch, a), self.stock(self.branch, b)), (6, 4, 7))
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.quantity, b.quantity), (10, 17))
+        self.assertEqual(
+            dict(StoreValuation.objects.values_list('store_id', 'value')),
+            {self.main.id: Decimal('84.00'), self.branch.id: Decimal('27.00')},
+        )
+        self.assertEqual(computed_valuations()[self.branch.id], Decimal('27.00'))
+        self.assertConsistent()
+
+
+class RecordSaleTests(StockTestCase):
+    def sell(self, lines, **kwargs):
+        with transaction.atomic():
+            return record_sale(self.user, lines, self.main, **kwargs)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self.sell([(self.products[0].id, 1, None)])  # order counter and rollup rows exist from here on
+        counts = []
+        for lines in ([(self.products[0].id, 1, None)], [(p.id, 1, None) for p in self.products]):
+            with CaptureQueriesContext(connection) as queries:
+                self.sell(lines)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_sale(self):
+        a, b, _ = self.products
+        sale = self.sell([(a.id, 2, None), (b.id, 1, Decimal('7.00'))])
+        self.assertTrue(sale.order_id.startswith('SO-'))
+        self.assertEqual(sale.total_amount, Decimal('27.00'))
+        self.assertEqual(sale.items.count(), 2)
+        self.assertEqual((self.stock(self.main, a), self.stock(self.main, b)), (8, 9))
+        self.assertEqual(DailySalesRollup.objects.get().revenue, Decimal('27.00'))
+        self.assertConsistent()
+
+    def test_oversell_is_refused_and_rolled_back(self):
+        a, b, _ = self.products
+        with self.assertRaisesMessage(Exception, "Not enough stock for Widget 1 in Main. Available: 10"):
+            self.sell([(a.id, 1, None), (b.id, 11, None)])
+        self.assertEqual((self.stock(self.main, a), self.stock(self.main, b)), (10, 10))
+        self.assertFalse(Sale.objects.exists())
+        self.assertConsistent()
+
+    def test_transfer_moves_stock_at_no_charge(self):
+        a = self.products[0]
+        sale = self.sell([(a.id, 3, None)], dest_store=self.branch)
+        self.assertTrue(sale.order_id.startswith('TR-'))
+        self.assertEqual(sale.total_amount, 0)
+        self.assertEqual((self.stock(self.main, a), self.stock(self.branch, a)), (7, 3))
+        a.refresh_from_db()
+        self.assertEqual(a.quantity, 10)
+        self.assertEqual(
+            sorted(StockLog.objects.filter(reason=f"Transfer {sale.order_id}").values_list('action', 'quantity_change')),
+            [('TRANSFER_IN', 3), ('TRANSFER_OUT', -3)],
+        )
+        self.assertEqual(StoreValuation.objects.get(store=self.branch).value, Decimal('4.50'))
+        self.assertConsistent()
+
+
+class OrderCounterTests(InventoryTestCase):
+    def test_reserve_hands_out_consecutive_ranges(self):
+        self.assertEqual(OrderCounter.reserve('PO-', 3), ['PO-0001', 'PO-0002', 'PO-0003'])
+        self.assertEqual(OrderCounter.next('PO-'), 'PO-0004')
+        self.assertEqual(OrderCounter.reserve('PO-', 2), ['PO-0005', 'PO-0006'])
+        self.assertEqual(OrderCounter.next('SO-'), 'SO-0001')
+
+    def test_new_counter_continues_after_existing_orders(self):
+        OrderCounter.objects.all().delete()
+        Sale.objects.create(order_id='SO-0041', user=User.objects.create_user('old'))
+        self.assertEqual(OrderCounter.reserve('SO-', 2), ['SO-0042', 'SO-0043'])
+
+
+class PosSyncTests(StockTestCase):
+    def upload(self, *sales):
+        self.client.force_login(self.user)
+        response = self.client.post('/api/pos/sync/', {'terminal': 'till-1', 'sales': list(sales)}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def queued(self, *lines):
+        return {'id': str(uuid.uuid4()), 'store': self.main.id, 'lines': [{'code': code, 'quantity': qty} for code, qty in lines]}
+
+    def test_replayed_upload_is_applied_once(self):
+        first, second = self.queued(('P0', 2)), self.queued(('P1', 1), ('P2', 1))
+        results = self.upload(first, second)
+        self.assertEqual([r['status'] for r in results], ['applied', 'applied'])
+        replay = self.upload(first, second)
+        self.assertEqual([r['status'] for r in replay], ['duplicate', 'duplicate'])
+        self.assertEqual([r['order_id'] for r in replay], [r['order_id'] for r in results])
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(self.stock(self.main, self.products[0]), 8)
+        self.assertConsistent()
+
+    def test_conflicts_do_not_stop_the_batch(self):
+        oversold, ok, unknown = self.queued(('P0', 11)), self.queued(('P0', 4)), self.queued(('NOPE', 1))
+        results = self.upload(oversold, ok, unknown)
+        self.assertEqual([r['status'] for r in results], ['conflict', 'applied', 'invalid'])
+        self.assertIn("Not enough stock", results[0]['message'])
+        self.assertEqual(self.stock(self.main, self.products[0]), 6)
+
+        # Restocked, the refused sale goes through on the next upload
+        with transaction.atomic():
+            apply_stock_changes({(self.main.id, self.products[0].id): 5})
+        self.assertEqual([r['status'] for r in self.upload(oversold, ok)], ['applied', 'duplicate'])
+        self.assertEqual(self.stock(self.main, self.products[0]), 0)
+        self.assertConsistent()
+
+    def test_unknown_customer_is_invalid(self):
+        customer = Customer.objects.create(name='Known', phone='555-0100')
+        known, missing = self.queued(('P0', 1)), self.queued(('P0', 1))
+        known['customer'], missing['customer'] = customer.id, customer.id + 1
+        results = self.upload(known, missing)
+        self.assertEqual([r['status'] for r in results], ['applied', 'invalid'])
+        self.assertIn('customer', results[1]['errors'])
+        self.assertEqual(Sale.objects.get().customer, customer)
+        self.assertEqual(self.stock(self.main, self.products[0]), 9)
+
+
+class ExportTests(StockTestCase):
+    def test_xlsx_export_opens_in_openpyxl(self):
+        Product.objects.filter(pk=self.products[0].pk).update(name='Bad\x01name')
+        self.client.force_login(User.objects.create_superuser('boss', password='pw'))
+        response = self.client.get('/exports/products/?format=xlsx')
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook['products 1'].values)
+        self.assertEqual(rows[0][:6], ('Code', 'Name', 'Category', 'Purchase Price', 'Selling Price', 'Total Quantity'))
+        self.assertEqual([row[:2] for row in rows[1:]], [('P0', 'Badname'), ('P1', 'Widget 1'), ('P2', 'Widget 2')])
+        self.assertEqual(rows[1][5], 10)
+
+
+class ProductApiPaginationTests(InventoryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('api', password='pw')
+        cls.store = Store.objects.create(name='Main')
+        cls.products = Product.objects.bulk_create([
+            Product(code=f'P{i:03}', name=f'Product {i}', purchase_price=1, selling_price=2)
+            for i in range(40)
+        ])
+
+    def walk(self, url):
+        self.client.force_login(self.user)
+        codes = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            codes += [p['code'] for p in response.json()['results']]
+            url = response.json()['next']
+        return codes
+
+    def test_pages_cover_products_sharing_updated_at(self):
+        # One stock update stamps every product with the same updated_at
+        with transaction.atomic():
+            apply_stock_changes({(self.store.id, p.id): 1 for p in self.products})
+        codes = self.walk('/api/products/?page_size=5')
+        self.assertEqual(sorted(codes), sorted(p.code for p in self.products))
+
+    def test_pages_follow_updates(self):
+        # A product updated mid-walk moves to the end of the (updated_at, id) order
+        self.client.force_login(self.user)
+        page = self.client.get('/api/products/?page_size=10').json()
+        Product.objects.filter(code=page['results'][0]['code']).update(updated_at=timezone.now() + timedelta(seconds=1))
+        codes = [p['code'] for p in page['results']] + self.walk(page['next'])
+        self.assertEqual(len(codes), 41)
+        self.assertEqual(codes[-1], codes[0])
+
+    def test_product_list_renders_one_page(self):
+        self.client.force_login(self.user)
+        with mock.patch('inventory.views.PRODUCT_PAGE_SIZE', 15):
+            first = self.client.get('/products/')
+            last = self.client.get('/products/?page=3')
+        self.assertEqual(len(first.context['rows']), 15)
+        self.assertContains(first, 'page=2')
+        self.assertEqual(len(last.context['rows']), 10)
+        self.assertContains(last, 'P039')
+        self.assertNotContains(last, 'P000')
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/products/?cursor=garbage').status_code, 400)
+
+    def test_cursor_values_must_match_their_fields(self):
+        self.client.force_login(self.user)
+        now = timezone.now().isoformat()
+        for values in ([{'a': 1}, 1], [now, 'x'], [now, True], [now, 1.5], [1, 1], [None, 1], ['not a date', 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.client.get(f'/api/products/?cursor={cursor}').status_code, 400, values)
+            # The sales ledger falls back to its first page
+            self.assertEqual(self.client.get(f'/reports/sales/?cursor={cursor}').status_code, 200, values)
+
+    def test_update_keeps_the_stored_quantity(self):
+        product = self.products[0]
+        stale = Product.objects.get(pk=product.pk)  # loaded before a sale moves the total
+        with transaction.atomic():
+            apply_stock_changes({(self.store.id, product.id): 5})
+        self.client.force_login(self.user)
+        with mock.patch.object(ProductViewSet, 'get_object', return_value=stale):
+            response = self.client.patch(f'/api/products/{product.pk}/', {'name': 'Renamed', 'quantity': 99},
+                                         content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.quantity), ('Renamed', 5))
+
+    def test_category_rename_changes_etag(self):
+        category = Category.objects.create(name='Tools')
+        Product.objects.filter(pk=self.products[0].pk).update(category=category)
+        self.client.force_login(self.user)
+        for url in ['/api/products/', f'/api/products/{self.products[0].pk}/']:
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            with self.captureOnCommitCallbacks(execute=True):
+                category.name = f'{category.name} renamed'
+                category.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pages_cover_repriced_products(self):
+        with transaction.atomic():
+            record_purchase(self.user, self.store, [(p.id, 1, 5) for p in self.products])
+        codes = self.walk('/api/products/?page_size=5')
+        self.assertEqual(sorted(codes), sorted(p.code for p in self.products))
+
+
+class SalesLedgerTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        archive_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_root)
+        self.enterContext(override_settings(ARCHIVE_ROOT=archive_root))
+        self.user = User.objects.create_user('clerk', password='pw')
+        self.store = Store.objects.create(name='Main')
+        self.product = Product.objects.create(code='P1', name='Widget', purchase_price=1, selling_price=2)
+        with transaction.atomic():
+            apply_stock_changes({(self.store.id, self.product.id): 1000})
+
+    def sell(self, count, when):
+        with transaction.atomic():
+            for _ in range(count):
+                record_sale(self.user, [(self.product.id, 1, None)], self.store, date=when)
+
+    def test_archived_sales_follow_a_full_live_page(self):
+        old = timezone.now() - timedelta(days=400)
+        self.sell(55, old)
+        self.sell(50, timezone.now())
+        archive_month(timezone.localdate(old).replace(day=1), 'sales')
+        self.assertEqual(Sale.objects.count(), 50)
+
+        self.client.force_login(self.user)
+        seen, query = [], ''
+        while query is not None:
+            response = self.client.get('/reports/sales/?' + query)
+            seen += [s.id for s in response.context['sales']]
+            query = response.context['next_params']
+        self.assertEqual(len(seen), 105)
+        self.assertEqual(len(set(seen)), 105)
+
+
+class DailySalesRollupTests(InventoryTestCase):
+    def test_deleting_a_sales_person_merges_their_rows(self):
+        user = User.objects.create_user('clerk')
+        store = Store.objects.create(name='Main')
+        person = SalesPerson.objects.create(name='Sam', phone='555-0101')
+        product = Product.objects.create(code='P1', name='Widget', purchase_price=1, selling_price=2)
+        with transaction.atomic():
+            apply_stock_changes({(store.id, product.id): 10})
+            record_sale(user, [(product.id, 1, None)], store)
+            record_sale(user, [(product.id, 2, None)], store, sales_person=person)
+            record_sale(user, [(product.id, 3, None)], store, sales_person=person, dest_store=Store.objects.create(name='Branch'))
+
+        person.delete()
+        self.assertEqual(
+            sorted(DailySalesRollup.objects.values_list('is_transfer', 'sales_person', 'revenue', 'orders', 'items')),
+            [(False, None, Decimal('6.00'), 2, 3), (True, None, Decimal('0.00'), 1, 3)],
+        )
+
+
+    def test_one_row_per_key_without_store_or_sales_person(self):
+        store = Store.objects.create(name='Main')
+        day = timezone.localdate()
+        for key in ({'store': store}, {'store': None}):
+            DailySalesRollup.objects.create(date=day, **key)
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                DailySalesRollup.objects.create(date=day, **key)
+
+
+class ImportJobTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def job(self, kind, content):
+        job = ImportJob(kind=kind, original_name='upload.csv')
+        job.file.save('upload.csv', ContentFile(content), save=False)
+        job.save()
+        return job
+
+    def test_upload_is_deleted_once_the_job_is_final(self):
+        for kind, status in (('customers', 'DONE'), ('unknown', 'FAILED')):
+            job = self.job(kind, b'name,phone\nAda,555-0100\n')
+            path = job.file.path
+            run_job(job)
+            job.refresh_from_db()
+            self.assertEqual(job.status, status)
+            self.assertEqual(job.file.name, '')
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(Customer.objects.filter(phone='555-0100').exists())
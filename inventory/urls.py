@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('products/', views.product_list, name='product_list'),
+    path('products/search/', views.product_search, name='product_search'),
     path('products/add/', views.product_create, name='product_create'),
     path('products/import/', views.product_import, name='product_import'),
     path('products/<int:pk>/edit/', views.product_update, name='product_update'),
@@ -14,9 +15,16 @@ urlpatterns = [
     path('categories/<int:pk>/delete/', views.category_delete, name='category_delete'),
 
     path('pos/', views.pos_view, name='pos'),
+    path('pos/lookup/', views.pos_lookup, name='pos_lookup'),
+    path('pos/scan/', views.pos_scan, name='pos_scan'),
+    path('pos/cart/', views.pos_cart, name='pos_cart'),
     path('purchase/', views.purchase_view, name='purchase'),
     path('reports/', views.report_view, name='reports'),
+    path('reports/sales/', views.sales_ledger, name='sales_ledger'),
+    path('exports/<str:kind>/', views.export_data, name='export_data'),
     path('transaction/<str:type>/<int:id>/', views.transaction_detail, name='transaction_detail'),
+    path('imports/<int:pk>/', views.import_job_detail, name='import_job_detail'),
+    path('imports/<int:pk>/progress/', views.import_job_progress, name='import_job_progress'),
     
     path('users/', views.user_list, name='user_list'),
     path('users/add/', views.user_create, name='user_create'),
@@ -39,11 +47,16 @@ urlpatterns = [
     path('stores/add/', views.store_create, name='store_create'),
     path('stores/<int:pk>/edit/', views.store_update, name='store_update'),
     path('stores/<int:pk>/delete/', views.store_delete, name='store_delete'),
+    path('stores/<int:pk>/stock-as-of/', views.store_stock_as_of, name='store_stock_as_of'),
+    path('cache/stats/', views.cache_status, name='cache_status'),
 ]
 
 from rest_framework.routers import DefaultRouter
 router = DefaultRouter()
 router.register(r'api/products', views.ProductViewSet)
 router.register(r'api/categories', views.CategoryViewSet)
+router.register(r'api/purchases', views.PurchaseViewSet)
+router.register(r'api/stock-movements', views.StockMovementViewSet, basename='stock-movement')
+router.register(r'api/pos/sync', views.PosSyncViewSet, basename='pos-sync')
 
 urlpatterns += router.urls
@@ -54,6 +54,7 @@ echo [INFO] Checking/Installing dependencies...
 echo [INFO] Syncing database changes...
 "%PYTHON_EXE%" manage.py makemigrations --noinput
 "%PYTHON_EXE%" manage.py migrate --noinput
+"%PYTHON_EXE%" manage.py createcachetable
 
 :: 5.1 Ensure Default Store (Multi-Store Support)
 echo [INFO] Validating Store Setup...
@@ -70,6 +71,10 @@ set TIMESTAMP=%TIMESTAMP: =0%
 echo [INFO] Backing up database...
 copy db.sqlite3 backups\db_backup_%TIMESTAMP%.sqlite3 >nul
 
+:: 7.1 Start background import worker (CSV/Excel uploads)
+echo [INFO] Starting import worker...
+start "Inventory Import Worker" /min "%PYTHON_EXE%" manage.py run_import_worker
+
 :: 8. Start server
 echo ==========================================
 echo [INFO] Starting server...